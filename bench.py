@@ -0,0 +1,451 @@
+''' Benchmarks of hot paths against local stand-in server (mock_server.py) and synthetic histories.
+    Run:  python bench.py session extract --corpus saved_pages/
+          python bench.py parse --latency 0.05 --error-rate 0.05 --json results.json
+          python bench.py startup    # fails if GUI or CLI start imports what they should load only when needed
+    Every benchmark prints its results and returns them as dict; --json writes them all to a file,
+    so results of different versions can be compared. '''
+
+import argparse
+import datetime as dt
+import gc
+import glob
+import json
+import os
+import platform
+import random
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request as ur
+import xml.etree.ElementTree as et
+from xml.sax.saxutils import quoteattr
+
+import http_session
+import mock_server
+import page_extractor
+import tcxml
+from mock_server import MockShop
+import storage
+from product_base import Item, ProductBase
+
+
+def fetch_without_session(url):
+    ''' How open_url() used to work: new SSL context and new connection for every page. '''
+
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    req = ur.Request(url, headers={'User-Agent': 'Magic Browser'})
+    return ur.urlopen(req, context=ctx).read()
+
+
+def get_item_data_old(html_file):
+    ''' How tcxml.get_item_data() used to work: several find() over whole decoded page. '''
+
+    name_string = 'class="product-title" itemprop="name">'
+    name_start = html_file.find(name_string) + len(name_string)
+    name_end = name_start + html_file[name_start:name_start + 100].find('</h1>')
+    name = html_file[name_start:name_end].strip()
+
+    info_start = html_file.find('<title>') + len('<title>')
+    info_end = html_file.find('</title>')
+    info = html_file[info_start:info_end]
+
+    price_string = 'itemprop="price" content="'
+    price_start = html_file.find(price_string) + len(price_string)
+    price_end = price_start + html_file[price_start:price_start + 7].find('"')
+    price = html_file[price_start:price_end] if price_start != 25 else 'NOT IN STOCK'
+
+    image_link_pos = html_file.find('class="fbox-product-image')
+    html_part = html_file[image_link_pos - 200:image_link_pos]
+    image_link_start = html_part.rfind('upload')
+    image_link_end = html_part.rfind('"')
+    image_link = 'https://topcomputer.ru/' + html_part[image_link_start:image_link_end]
+
+    return name, price, image_link, info
+
+
+def bench_session(args):
+    ''' Fetch the same set of pages with and without shared keep-alive session. '''
+
+    pages = args.pages
+    with MockShop() as shop:
+        urls = [shop.url(f'cpu-{n}') for n in range(pages)]
+        for n in range(pages):
+            shop.page(f'cpu-{n}')  # generate pages before timing
+
+        started = time.perf_counter()
+        for url in urls:
+            fetch_without_session(url)
+        old_time = time.perf_counter() - started
+        old_connections = shop.connections
+
+        session = http_session.Session()
+        started = time.perf_counter()
+        for url in urls:
+            session.get(url)
+        new_time = time.perf_counter() - started
+        new_connections = shop.connections - old_connections
+        session.close()
+
+    print(f'{pages} pages')
+    print(f'  urlopen:  {old_time:.2f} s, {old_time / pages * 1000:.2f} ms/page, {old_connections} connections')
+    print(f'  session:  {new_time:.2f} s, {new_time / pages * 1000:.2f} ms/page, {new_connections} connections')
+    print(f'  handshakes avoided: {old_connections - new_connections}, speedup x{old_time / new_time:.1f}')
+    return {'pages': pages, 'urlopen_s': old_time, 'session_s': new_time,
+            'urlopen_connections': old_connections, 'session_connections': new_connections}
+
+
+def bench_extract(args, repeat=20):
+    ''' Old get_item_data (decode + find) against page_extractor on raw bytes.
+        Uses saved product pages from --corpus directory (*.html), or generated ones. '''
+
+    if args.corpus:
+        pages = []
+        for filename in sorted(glob.glob(os.path.join(args.corpus, '*.htm*'))):
+            with open(filename, 'rb') as page_file:
+                pages.append(page_file.read())
+    else:
+        pages = [mock_server.product_page(f'cpu-{n}', mock_server.slug_price(f'cpu-{n}')) for n in range(50)]
+    if not pages:
+        print('  no pages in corpus')
+        return {}
+    total_mb = sum(map(len, pages)) * repeat / 1e6
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            get_item_data_old(page.decode('utf-8', errors='ignore'))  # open_url() decoded every page
+    old_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            tcxml.get_item_data(page)
+    new_time = time.perf_counter() - started
+
+    mismatches = sum(tuple(tcxml.get_item_data(page)) != get_item_data_old(page.decode('utf-8', errors='ignore'))
+                     for page in pages)
+    count = len(pages) * repeat
+    print(f'{len(pages)} pages x {repeat}, {total_mb:.1f} MB')
+    print(f'  find/slice:  {old_time / count * 1e6:.0f} us/page, {total_mb / old_time:.0f} MB/s')
+    print(f'  extractor:   {new_time / count * 1e6:.0f} us/page, {total_mb / new_time:.0f} MB/s')
+    print(f'  speedup x{old_time / new_time:.1f}, pages with different result: {mismatches}')
+    return {'pages': len(pages), 'repeat': repeat, 'find_slice_us_per_page': old_time / count * 1e6,
+            'extractor_us_per_page': new_time / count * 1e6, 'mismatches': mismatches}
+
+
+def bench_stream(args):
+    ''' Whole page download + extraction against streaming download stopped by extractor. '''
+
+    pages = args.pages
+    results = {'pages': pages}
+    for compress in (False, True):
+        with MockShop(etags=False, gzip=compress) as shop:
+            urls = [shop.url(f'cpu-{n}') for n in range(pages)]
+            for n in range(pages):
+                shop.page(f'cpu-{n}', compressed=True) if compress else shop.page(f'cpu-{n}')
+            print(f'{pages} pages, {"gzip" if compress else "no compression"}')
+
+            for mode in ('whole page', 'streaming'):
+                session = http_session.Session(compress=compress)
+                connections = shop.connections
+                started = time.perf_counter()
+                for url in urls:
+                    if mode == 'whole page':
+                        tcxml.get_item_data(session.get(url).body)
+                    else:
+                        extractor = page_extractor.PageExtractor()
+                        session.get(url, consumer=extractor.feed)
+                        extractor.result()
+                elapsed = time.perf_counter() - started
+                session.close()
+                print(f'  {mode:10}:  {elapsed / pages * 1000:.2f} ms/page, '
+                      f'{session.bytes_received / pages / 1000:.1f} kB/page received, '
+                      f'{shop.connections - connections} connections')
+                key = f'{"gzip" if compress else "plain"}_{mode.replace(" ", "_")}'
+                results[key + '_ms_per_page'] = elapsed / pages * 1000
+                results[key + '_kb_per_page'] = session.bytes_received / pages / 1000
+    return results
+
+
+def write_history(filename, items, prices):
+    ''' Synthetic XML history: items x prices, one price a day, some of them NOT IN STOCK. '''
+
+    rnd = random.Random(items * prices)
+    start = dt.datetime(2015, 1, 1, 12, 0)
+    dates = [(start + dt.timedelta(days=n)).strftime('%Y.%m.%d %H:%M') for n in range(prices)]
+    with open(filename, 'w', encoding='utf-8') as xml_file:
+        xml_file.write("<?xml version='1.0' encoding='utf-8'?>\n<root>")
+        for n in range(items):
+            price = rnd.randrange(5_000, 100_000)
+            xml_file.write(f'<item name={quoteattr(f"Процессор {n}")}><url>https://topcomputer.ru/tovary/cpu-{n}/</url>'
+                           f'<info>Процессор {n} купить в Москве</info>'
+                           f'<image>https://topcomputer.ru/upload/iblock/cpu-{n}.jpg</image>')
+            for date in dates:
+                if rnd.random() < 0.05:
+                    price = max(1000, price + rnd.randrange(-2000, 2000))
+                text = price if rnd.random() > 0.02 else 'NOT IN STOCK'
+                xml_file.write(f'<price date="{date}">{text}</price>')
+            xml_file.write('</item>')
+        xml_file.write('</root>')
+
+
+def load_old(filename):
+    ''' How ProductBase.parse_xml() used to work: whole tree is parsed and kept alongside Items. '''
+
+    data = et.parse(filename)
+    xmlroot = data.getroot()
+    items = []
+    for entry in xmlroot.findall('item'):
+        prices = dict()
+        for subentry in entry.findall('price'):
+            prices[f'{subentry.attrib["date"]}'] = subentry.text
+        items.append(Item(entry.attrib['name'].strip(), entry.find('info').text.strip(), entry.find('url').text.strip(),
+                          entry.find('image').text.strip(), prices))
+    return data, items
+
+
+def measure(function, *args):
+    ''' Returns (seconds, peak MB, MB still used by result) of function(*args). '''
+
+    gc.collect()
+    started = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    result = function(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak / 1e6, current / 1e6
+
+
+def bench_load(args):
+    ''' Loading synthetic history of --items x --prices: old DOM loader, streaming ProductBase, summary mode. '''
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, 'history.xml')
+        write_history(filename, args.items, args.prices)
+        print(f'{args.items} items x {args.prices} prices, {os.path.getsize(filename) / 1e6:.0f} MB XML')
+
+        results = {'items': args.items, 'prices': args.prices}
+        # measure() loads twice, ProductBase must not write snapshot on first load and read it on second
+        for title, key, function, *function_args in (('et.parse + Items', 'dom', load_old, filename),
+                                                     ('ProductBase', 'base', ProductBase, filename, None, False),
+                                                     ('ProductBase(keep_last=10)', 'summary', ProductBase, filename,
+                                                      10, False)):
+            elapsed, peak, kept = measure(function, *function_args)
+            print(f'  {title:26} {elapsed:6.2f} s, peak {peak:6.0f} MB, kept {kept:6.0f} MB')
+            results.update({f'{key}_s': elapsed, f'{key}_peak_mb': peak, f'{key}_kept_mb': kept})
+    return results
+
+
+def write_url_list(filename, urls):
+    ''' XML with items that have only name and URL, as LinkEditor saves it. '''
+
+    root = et.Element('root')
+    for n, url in enumerate(urls):
+        item = et.SubElement(root, 'item', name=f'Процессор cpu-{n}')
+        et.SubElement(item, 'url').text = url
+    et.ElementTree(root).write(filename, encoding='utf-8', xml_declaration=True)
+
+
+def bench_parse(args):
+    ''' Whole tcxml.parse() run over --pages items against mock server with --latency, --page-size
+        and --error-rate: first run downloads everything, second one gets 304 Not Modified,
+        third one takes prices from category listing pages instead of item pages. '''
+
+    results = {'pages': args.pages, 'latency': args.latency, 'page_size': args.page_size, 'error_rate': args.error_rate}
+    with MockShop(page_size=args.page_size, error_rate=args.error_rate, latency=args.latency, seed=1) as shop, \
+            tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, 'urls.xml')
+        write_url_list(filename, [shop.url(f'cpu-{n}') for n in range(args.pages)])
+        for n in range(args.pages):
+            shop.page(f'cpu-{n}')  # generate pages before timing
+        print(f'{args.pages} pages of {args.page_size / 1000:.0f} kB, latency {args.latency * 1000:.0f} ms, '
+              f'error rate {args.error_rate:.0%}')
+
+        for run in ('cold', 'cached', 'listing'):
+            requests = shop.requests
+            started = time.perf_counter()
+            if run == 'listing':
+                state = tcxml.parse(filename, rate_limit=0, use_cache=False, listings=[shop.listing_url('cpu')])
+            else:
+                state = tcxml.parse(filename, rate_limit=0)
+            elapsed = time.perf_counter() - started
+            loop = state.elapsed if state is not None else 0.0  # without opening file and final commit
+            print(f'  {run:7} {elapsed:6.2f} s, {args.pages / loop if loop else 0:7.1f} pages/sec, '
+                  f'{shop.requests - requests} requests, {state.errors} errors')
+            results.update({f'{run}_s': elapsed, f'{run}_pages_per_sec': args.pages / loop if loop else 0,
+                            f'{run}_requests': shop.requests - requests, f'{run}_errors': state.errors})
+    return results
+
+
+def bench_base(args):
+    ''' ProductBase operations on synthetic history of --items x --prices: load, loading prices of one more run,
+        deleting prices from file, migration to price changes only and load after it, load from snapshot,
+        and GUI summaries (get_total, get_price_summary for every item). '''
+
+    results = {'items': args.items, 'prices': args.prices}
+
+    def timed(key, title, function, *function_args):
+        started = time.perf_counter()
+        result = function(*function_args)
+        results[key + '_s'] = elapsed = time.perf_counter() - started
+        print(f'  {title:34} {elapsed * 1000:9.1f} ms')
+        return result
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, 'history.xml')
+        write_history(filename, args.items, args.prices)
+        print(f'{args.items} items x {args.prices} prices')
+
+        pbase = timed('load', 'ProductBase (parse_xml)', ProductBase, filename, None, False)
+
+        # one more run of parser, as tcxml.parse() writes it
+        store = storage.open_storage(filename)
+        date = (dt.datetime(2015, 1, 1, 12, 0) + dt.timedelta(days=args.prices)).strftime('%Y.%m.%d %H:%M')
+        for url, latest_price in store.tracked_urls():
+            store.add_price(url, None, date)
+        timed('write_run', 'write one run (commit)', store.commit)
+        store.close()
+        timed('parse_xml_new_run', 'parse_xml with one new run', pbase.parse_xml)
+
+        for item in pbase.items[::10]:  # delete oldest price of every 10th item
+            pbase.delete_price(item.url, next(iter(item.prices)))
+        timed('apply_changes', 'apply_changes_to_xml', pbase.apply_changes_to_xml)
+
+        size = os.path.getsize(filename)
+        before, after = timed('compress', 'storage.compress (migration)', storage.compress, filename)
+        print(f'  {before} prices -> {after} changes, {size / 1e6:.1f} -> {os.path.getsize(filename) / 1e6:.1f} MB')
+        results.update({'prices_stored': before, 'changes_stored': after,
+                        'size_mb': size / 1e6, 'compressed_size_mb': os.path.getsize(filename) / 1e6})
+        pbase = timed('load_compressed', 'ProductBase after migration', ProductBase, filename, None, False)
+        timed('load_write_snapshot', 'ProductBase, writing snapshot', ProductBase, filename)
+        pbase = timed('load_snapshot', 'ProductBase from snapshot', ProductBase, filename)
+
+        try:
+            from gui_methods import GUIMethods  # needs tkinter and PIL
+        except ImportError as error:
+            print(f'  GUI summaries skipped: {error}')
+            return results
+
+        class Label:  # only computation is measured, not drawing
+            def config(self, **options):
+                pass
+
+        parent = type('Parent', (), {'pbase': pbase})()
+        for name in ('lb_price_sum_latest', 'lb_price_sum_low', 'lb_price_sum_high',
+                     'lb_price_sum_average', 'lb_price_sum_moving_average'):
+            setattr(parent, name, Label())
+        timed('get_total', 'get_total', GUIMethods.get_total, parent)
+        timed('get_price_summary_all', f'get_price_summary x {len(pbase.items)}',
+              lambda: [GUIMethods.get_price_summary(parent, item) for item in pbase.items])
+    return results
+
+
+STARTUP_RUNS = 5  # fresh interpreters per module, best time is taken
+# entry module -> modules it must not import at start, they are loaded when first needed
+DEFERRED = {
+    'gui': ('PIL', 'tcxml', 'http_session', 'http.client', 'ssl', 'product_base', 'storage', 'sqlite3',
+            'linkedit', 'webbrowser'),
+    'linkedit': ('tcxml', 'http_session', 'http.client', 'ssl', 'storage', 'sqlite3', 'webbrowser'),
+    'tcxml': ('tkinter', 'PIL', 'product_base'),
+}
+
+
+def import_times(module):
+    ''' {module: cumulative seconds} of everything imported by import of module in fresh interpreter,
+        from python -X importtime. '''
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = dict()
+    for line in result.stderr.splitlines():  # import time:  self [us] | cumulative | imported package
+        if line.startswith('import time:'):
+            self_time, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():  # not header
+                times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def bench_startup(args):
+    ''' Import time of GUI, Link Editor and CLI entry modules, each in fresh interpreter, best of STARTUP_RUNS.
+        Modules in DEFERRED must not be imported at start: if one is, it's reported as regression
+        and bench.py exits with error. '''
+
+    results = {'regressions': []}
+    for module in DEFERRED:
+        try:
+            runs = [import_times(module) for _ in range(STARTUP_RUNS)]
+        except RuntimeError as error:  # e.g. tkinter is not installed
+            print(f'  {module:10} skipped: {error}')
+            continue
+        best = min(run[module] for run in runs)
+        imported = [name for name in DEFERRED[module] if name in runs[0]]
+        print(f'  {module:10} {best * 1000:7.1f} ms, {len(runs[0])} modules'
+              + (f', imports at start: {", ".join(imported)}' if imported else ''))
+        results[f'{module}_s'] = best
+        results[f'{module}_modules'] = len(runs[0])
+        results['regressions'] += [f'{module} imports {name}' for name in imported]
+    return results
+
+
+BENCHMARKS = {
+    'session': bench_session,
+    'extract': bench_extract,
+    'stream': bench_stream,
+    'load': bench_load,
+    'parse': bench_parse,
+    'base': bench_base,
+    'startup': bench_startup,
+}
+
+
+def environment():
+    ''' What results were measured on. '''
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'time': dt.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': sys.version.split()[0], 'platform': platform.platform()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run: {", ".join(BENCHMARKS)}; all if none given')
+    parser.add_argument('--corpus', help='directory with saved product pages for extract benchmark')
+    parser.add_argument('--items', type=int, default=2000, help='items in synthetic history (default 2000)')
+    parser.add_argument('--prices', type=int, default=500, help='prices of every item in synthetic history (default 500)')
+    parser.add_argument('--pages', type=int, default=200, help='pages downloaded by network benchmarks (default 200)')
+    parser.add_argument('--page-size', type=int, default=mock_server.PAGE_SIZE,
+                        help=f'size of generated pages, bytes (default {mock_server.PAGE_SIZE})')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds mock server waits before every page (default 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='part of pages answered with 503 (default 0)')
+    parser.add_argument('--json', help='write results to this file as JSON')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+
+    results = dict()
+    for name in args.names or BENCHMARKS:
+        print(f'--- {name}')
+        results[name] = BENCHMARKS[name](args)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump({'environment': environment(), 'results': results}, json_file, indent=2)
+    if results.get('startup', {}).get('regressions'):
+        sys.exit('Startup regressions: ' + '; '.join(results['startup']['regressions']))
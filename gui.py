@@ -1,9 +1,10 @@
 import tkinter as tk
 
-from tkinter.ttk import Button, Label, Frame, Combobox, Treeview, Scrollbar, Style
-from PIL import Image, ImageTk
+from tkinter.ttk import Button, Label, Frame, Progressbar
 
-from gui_methods import GUIMethods as gm  # local module
+from gui_methods import GUIMethods as gm  # local modules
+from image_loader import ImageLoader, open_photo
+from widgets import FilterCombobox, VirtualTable
 
 
 class GUI(tk.Tk):
@@ -12,7 +13,7 @@ class GUI(tk.Tk):
         super().__init__()
 
         # setup window
-        self.geometry('650x585')
+        self.geometry('760x620')
         self.resizable(False, False)
         self.title('TopComputer.Ru Parser')
 
@@ -35,11 +36,25 @@ class GUI(tk.Tk):
         self.btn_exit = Button(self.buttons_frame, text='Exit', command=self.destroy, width=10)
         self.btn_exit.pack(side='right', padx=10)
 
-        # dropdown list
-        self.item_list = Combobox(state='readonly', height=20)
+        # dropdown list, typing filters it
+        self.item_list = FilterCombobox(height=20)
         self.item_list.pack(fill='both', padx=10)
         self.item_list.bind('<<ComboboxSelected>>', lambda event: gm.select_item(self, event))
 
+        # update progress at the bottom (packed before item info frames to keep its place)
+        self.progress_frame = Frame()
+        self.progress_frame.pack(side='bottom', fill='x', pady=(0, 10))
+
+        self.btn_cancel = Button(self.progress_frame, text='Cancel', state='disabled',
+                                 command=lambda: gm.cancel_update(self), width=10)
+        self.btn_cancel.pack(side='right', padx=10)
+
+        self.progress = Progressbar(self.progress_frame, orient='horizontal', mode='determinate')
+        self.progress.pack(side='left', fill='x', expand=True, padx=10)
+
+        self.lb_progress = Label(self.progress_frame, width=36)
+        self.lb_progress.pack(side='left')
+
         # frames for better elements alignment control
         self.info_frame_left = Frame()
         self.info_frame_left.pack(side='left', fill='both', pady=10)
@@ -71,9 +86,10 @@ class GUI(tk.Tk):
 
 
         # image
-        self.noimg = ImageTk.PhotoImage(file='noimg.jpg')
+        self.noimg = open_photo('noimg.jpg')
         self.imagebox = Label(self.info_frame_left, image=self.noimg, anchor='center', background='white')
         self.imagebox.pack(anchor='center', side='top', padx=10, fill='both')
+        self.images = ImageLoader(self)  # downloads and caches item images in background
 
         # info label (from tk to set height parameter, which ttk label doesn't have)
         self.lb_info = tk.Label(self.info_frame_left, width=55, height=2, pady=10,
@@ -85,25 +101,34 @@ class GUI(tk.Tk):
         self.btn_browse = Button(self.info_frame_left, width=20, text='Go to store', command=lambda: gm.browse(self))
         self.btn_browse.pack(anchor='center', side='top')
 
-        # table with dates and prices
-        self.prices = Treeview(self.info_frame_prices, height=18, show='headings', columns=('col1', 'col2'))
-        self.prices.heading('col1', text='Date')
-        self.prices.heading('col2', text='Price')
-        self.prices.column('col1', anchor='w', width=110)
-        self.prices.column('col2', anchor='center', width=110)
-        self.prices.bind('<Delete>', lambda event: gm.delete_price(self, event))
-
-        # scroll for table
-        self.vscroll = Scrollbar(self.info_frame_prices, orient='vertical', command=self.prices.yview)
-        self.prices.config(yscrollcommand=self.vscroll.set)
-
-        self.vscroll.pack(side='right', fill='y')
+        # table with dates price changed, prices and when they were last seen,
+        # with its own scroll: only visible rows are in it
+        self.prices = VirtualTable(self.info_frame_prices, height=18,
+                                   columns=[('Date', 110, 'w'), ('Price', 110, 'center'), ('Last seen', 110, 'w')])
+        self.prices.tree.bind('<Delete>', lambda event: gm.delete_price(self, event))
         self.prices.pack(side='top')
 
         # no xml file selected on start
         self.xml_file = ''
         self.current_url = ''
-        self.selected = ''
-
-
-GUI().mainloop()
\ No newline at end of file
+        self.current_img_url = ''
+        self.selected = ''          # URL of selected item
+        self.item_urls = {}         # name in combobox -> URL of item, see gm._set_names
+        self.update_thread = None   # background update, see gm.update_db
+        self.update_cancel = None   # threading.Event to stop it
+
+    def destroy(self):
+        ''' Window is hidden at once; while update is running, it's destroyed only after update has saved
+            prices parsed so far. Update is polled, not joined: downloads may take a while to stop. '''
+
+        if self.update_thread is not None and self.update_thread.is_alive():
+            self.update_cancel.set()
+            self.withdraw()
+            self.after(100, self.destroy)
+            return
+        self.images.close()
+        super().destroy()
+
+
+if __name__ == '__main__':  # imported by bench.py to measure startup
+    GUI().mainloop()
@@ -1,57 +1,31 @@
+import collections
 import os.path
-import ssl
+import queue
+import threading
 import tkinter as tk
 import tkinter.filedialog as fd
-import urllib.request as ur
-import webbrowser as wb
 
-from io import BytesIO
-from PIL import Image, ImageTk
 from tkinter.ttk import Button, Label, Frame, Combobox, Treeview, Scrollbar, Style
 from tkinter import messagebox as mbox
 
-# import local modules
-import tcxml
-from product_base import ProductBase
-from linkedit import LinkEditor
+# local modules tcxml (network stack), product_base (storage, sqlite3) and linkedit,
+# and webbrowser are imported by methods which need them, so window appears without waiting for them
 
 class GUIMethods:
 
-    def _resize_image(parent, image, new_size):
-        ''' Calculate new image size and return Image object. '''
-
-        size_x, size_y = image.size
-        if size_x >= size_y:
-            k = size_x / new_size
-            new_size_x = new_size
-            new_size_y = int(size_y // k)
-        else:
-            k = size_y / new_size
-            new_size_y = new_size
-            new_size_x = int(size_x // k)
-
-        resized = image.resize((new_size_x, new_size_y))
-
-        # create white background for image to exactly fit square
-        bg = Image.new('RGBA', (new_size, new_size), (255, 255, 255, 255))
-        offset = ((new_size - new_size_x) // 2, (new_size - new_size_y) // 2)  # paste to center
-        bg.paste(resized, offset)
-
-        return bg
-
-
     def _clear(parent, full=True):
         ''' Clear all item info. '''
 
         if full:  # empty combobox
-            parent.item_list.config(values='')
+            parent.item_list.set_names([])
             parent.item_list.set('')
+            parent.item_urls = {}
 
-        for item in parent.prices.get_children():  # clear table
-            parent.prices.delete(item)
-        parent.item_picture = ImageTk.PhotoImage(Image.open('noimg.jpg'))
+        parent.prices.clear()
+        parent.item_picture = parent.noimg
         parent.imagebox.config(image=parent.item_picture)
         parent.current_url = ''
+        parent.current_img_url = ''
         parent.lb_info.config(text='')
         parent.lb_price_sum_low.config(text='')
         parent.lb_price_sum_high.config(text='')
@@ -66,7 +40,8 @@ class GUIMethods:
             Asks for .urls file, checks if file isn't empty, sets corresponding XML file name, 
             checks if that file exists and has data, then if yes, calls load_xml() and get_item_info(). '''
 
-        parent.xml_file = fd.askopenfilename(title='Open XML', filetypes=[('XML documents', '*.xml')])
+        parent.xml_file = fd.askopenfilename(title='Open XML', filetypes=[('XML documents', '*.xml'),
+                                                                          ('SQLite databases', '*.sqlite *.sqlite3 *.db')])
 
         if parent.xml_file:  # not empty
 
@@ -80,6 +55,7 @@ class GUIMethods:
             else:
                 cls._clear(parent)
                 if os.path.getsize(parent.xml_file) > 15:  # file has more data than just <root></root>
+                    from product_base import ProductBase
                     parent.pbase = ProductBase(parent.xml_file)  # get all info from XML and put into one list of Item objects
 
                     total_price = cls.get_total(parent)
@@ -92,30 +68,35 @@ class GUIMethods:
     def load_item_list(cls, parent):
         ''' Get data from parent.items file and put it into ComboBox (parent.item_list). '''
 
-        # create list of items for combobox
-        parent.item_list.config(values=list(item.name for item in parent.pbase.items))
+        # create list of items for combobox, it shows first of them and ones matching typed text
+        cls._set_names(parent)
         parent.item_list.current(0)   # set default combobox item
-        parent.selected = parent.item_list.get()
+        parent.selected = parent.item_urls.get(parent.item_list.get(), '')
         cls.get_item_info(parent, parent.selected)
+
+
+    def _set_names(parent):
+        ''' Put names of items into ComboBox. Items are known by URL, names may be empty or the same,
+            so such names get URL of item added. parent.item_urls is {name in ComboBox: URL}. '''
+
+        items = parent.pbase.items
+        counts = collections.Counter(item.name for item in items)
+        parent.item_urls = {}
+        for item in items:
+            if not item.name:
+                name = item.url
+            elif counts[item.name] > 1:
+                name = f'{item.name} ({item.url})'
+            else:
+                name = item.name
+            parent.item_urls[name] = item.url
+        parent.item_list.set_names(parent.item_urls)
         
 
     @classmethod
     def get_total(cls, parent):
-        current_prices = []  # only prices for items that are in stock
-        for item in parent.pbase.items:
-            all_prices = list(item.prices.values())
-            total_prices = len(all_prices)
-            # perhaps this should be done differently
-            if total_prices == 1 and all_prices[0].isnumeric():
-                current_prices.append(all_prices[0])  # in case there's only one price record
-            else:
-                for n in range(-1, -total_prices, -1):
-                    latest_price = all_prices[n]
-                    if latest_price.isnumeric():  # item is in stock
-                        current_prices.append(latest_price)
-                        break
-                
-        return sum(list(map(int, current_prices)))
+        ''' Sum of latest prices when items were in stock, from precomputed stats. '''
+        return parent.pbase.stats.total()
 
 
     @classmethod
@@ -123,61 +104,70 @@ class GUIMethods:
         ''' COMBOBOX COMMAND
             Select item from ComboBox. '''
 
-        parent.selected = event.widget.get()  # item name as plain text string
+        parent.selected = parent.item_urls.get(event.widget.get(), '')  # URL of item
         cls.get_item_info(parent, parent.selected)
 
 
     @classmethod
     def get_item_info(cls, parent, selected):
-        ''' Get selected item info and show in GUI. Item is string containing item name (from XML tag <name>)'''
+        ''' Get selected item info and show in GUI. Item is string containing item URL (from XML tag <url>)'''
 
         cls._clear(parent, full=False)  # do not empty combobox
 
-        for item in parent.pbase.items:
-            if item.name == selected:
+        item = parent.pbase.get_item(selected)
+        if item is not None:
+            parent.pbase.load_history(item)  # if base keeps only latest prices
+
+            # fill prices table, rows are made only when they are scrolled to
+            parent.prices.set_rows(len(item.prices), item.prices.item_at)
+
+            # image is loaded in background (or taken from cache) and shown when ready
+            parent.current_img_url = item.img_url
+            if item.img_url:  # exists (item has some information)
+                parent.images.request(item.img_url, lambda photo: cls._show_image(parent, item.img_url, photo))
+            cls._prefetch_neighbours(parent)
+
+            parent.current_url = item.url  # url as given in .urls file
 
-                # fill prices table
-                for date in item.prices:
-                    parent.prices.insert('', index='end', values=(date, item.prices[date]))
+            if item.info:
+                parent.lb_info.config(text=item.info)  # info from product page title
 
-                # get and process image
-                if item.img_url:  # exists (item has some information)
-                    # ignore ssl
-                    ctx = ssl.create_default_context()
-                    ctx.check_hostname = False
-                    ctx.verify_mode = ssl.CERT_NONE                      
-                    image_b = ur.urlopen(item.img_url, context=ctx).read()  # type == bytes
-                    image = Image.open(BytesIO(image_b))
-                    resized_image = cls._resize_image(cls, image, 382)  # resize to fit in 382x382 px
-                    parent.item_picture = ImageTk.PhotoImage(resized_image)
-                    parent.imagebox.config(image=parent.item_picture)
+            cls.get_price_summary(parent, item)
 
-                parent.current_url = item.url  # url as given in .urls file
+    def _show_image(parent, img_url, photo):
+        ''' Show loaded image, unless another item was selected while it was loading. '''
 
-                if item.info:
-                    parent.lb_info.config(text=item.info)  # info from product page title
+        if photo is not None and img_url == parent.current_img_url:
+            parent.item_picture = photo
+            parent.imagebox.config(image=parent.item_picture)
+
+
+    def _prefetch_neighbours(parent):
+        ''' Start loading images of items next to selected one in combobox, they are likely to be selected next. '''
+
+        current = parent.item_list.current()
+        names = parent.item_list['values']
+        urls = [parent.item_urls.get(name) for name in names]
+        neighbours = (parent.pbase.get_item(urls[index]) for index in (current + 1, current - 1)
+                      if current != -1 and 0 <= index < len(names))
+        parent.images.prefetch(item.img_url for item in neighbours if item is not None)
 
-                cls.get_price_summary(parent, item)
 
     @classmethod
     def get_price_summary(cls, parent, item):
         ''' Get highest, lowest, latest and average price for selected item. '''
 
-        price_list = [int(price) for price in list(item.prices.values()) if price != 'NOT IN STOCK']
+        stats = parent.pbase.stats.get(item.url)  # computed on load, not on every selection
 
-        if len(price_list) == 0:  # no values added yet, nothing to display
+        if stats is None or stats.count == 0:  # no values added yet, nothing to display
             latest_price = min_price = max_price = alltime_average_price = twopoint_average_price = moving_average_price = 'N/A'
         else:
-            latest_price = price_list[-1]
-            min_price = min(price_list)
-            max_price = max(price_list)
-            alltime_average_price = int(sum(price_list) / len(price_list))
+            latest_price = stats.latest
+            min_price = stats.minimum
+            max_price = stats.maximum
+            alltime_average_price = stats.mean
             twopoint_average_price = (min_price + max_price) // 2
-
-            if len(price_list) > 9:
-                moving_average_price = sum(price_list[-10:]) // 10
-            else:
-                moving_average_price = sum(price_list[-len(price_list):]) // len(price_list)
+            moving_average_price = stats.moving_average(10)
 
         if latest_price <= moving_average_price:  # set green text color if current price is lower than average
             parent.lb_price_sum_latest.config(foreground='#009900')
@@ -193,48 +183,131 @@ class GUIMethods:
 
     @classmethod
     def update_db(cls, parent):
-        ''' Run parser and change text on button while parsing. '''
+        ''' Run parser in background thread, so window stays responsive; show its progress.
+            Prices are added to ProductBase as pages are parsed, base is not reloaded after update. '''
 
         if parent.xml_file == '':
             cls.open_xml_file(parent)  # show Open File dialogue
 
-        if parent.xml_file != '':  # two ifs in case user pressed Cancel in Open File dialogue; do nothing in that case
-
+        if parent.xml_file != '' and parent.update_thread is None:  # user may have pressed Cancel in Open File dialogue
+                                                                    # or update may be running already
             # save changes to XML (deleted price entries)
             parent.pbase.apply_changes_to_xml()
 
-            # run parser to update
-            parent.btn_parse['text'] = 'Updating...'
-            parent.update()  # update window to show changed button
+            parent.btn_parse.config(text='Updating...', state='disabled')
+            for button in (parent.btn_open_urls_file, parent.btn_edit_urls):  # file must not change during update
+                button.config(state='disabled')
+            parent.btn_cancel.config(state='normal')
+            parent.progress.config(value=0)
+            parent.lb_progress.config(text='Starting...')
+
+            import tcxml  # on main thread, before update thread needs it
+            messages = queue.Queue()  # tcxml.Progress for every page, then None or exception at the end
+            parent.update_cancel = threading.Event()
+
+            def run(xml_file, cancel):
+                try:
+                    tcxml.parse(xml_file, progress=messages.put, cancel=cancel)
+                except Exception as error:  # any error must reach main thread, otherwise GUI waits forever
+                    messages.put(error)
+                else:
+                    messages.put(None)
+
+            parent.update_thread = threading.Thread(target=run, args=(parent.xml_file, parent.update_cancel))
+            parent.update_thread.start()
+            parent.after(100, lambda: cls._poll_update(parent, messages))
+
+
+    @classmethod
+    def _poll_update(cls, parent, messages, state=None):
+        ''' Take progress of update from queue (on main thread, as Tk requires) and show it.
+            state is the latest tcxml.Progress seen so far. '''
+
+        import tcxml  # already loaded by update_db()
+
+        finished = False
+        received = False
+        updated_urls = set()
+        while not finished:
             try:
-                tcxml.parse(parent.xml_file)
-            except FileNotFoundError:
-                mbox.showwarning(title='No data',
-                                 message='XML file not found. Check program folder or update data.')
-            parent.btn_parse['text'] = 'Update database'  # set button text back to default
-            cls.load_item_list(parent)
-            parent.pbase.parse_xml()  # add new prices to internal database
-            cls.get_item_info(parent, parent.item_list.get())
+                message = messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if isinstance(message, tcxml.Progress):
+                state = message
+                received = True
+                if state.error is None:
+                    parent.pbase.add_price(state.url, state.item_data, state.date)
+                    updated_urls.add(state.url.strip())
+            else:
+                finished = True
+                parent.update_thread.join()
+                parent.update_thread = parent.update_cancel = None
+                if isinstance(message, FileNotFoundError):
+                    mbox.showwarning(title='No data',
+                                     message='XML file not found. Check program folder or update data.')
+                elif message is not None:
+                    mbox.showerror(title='Update failed', message=str(message))
+                else:  # base has all prices of file now, next start doesn't have to parse it
+                    parent.pbase.save_snapshot()
+
+        if state is not None and (received or finished):
+            parent.progress.config(maximum=state.total, value=state.done)
+            eta = f', {state.eta:.0f} s left' if not finished and state.eta is not None else ''
+            parent.lb_progress.config(text=f'{state.done}/{state.total} pages, {state.errors} errors{eta}')
             parent.title(f'TopComputer.Ru Parser - {os.path.basename(parent.xml_file)}, total price: {cls.get_total(parent)}')
+            if parent.current_url in updated_urls:  # show new price of selected item
+                cls.get_item_info(parent, parent.selected)
+        elif finished:  # there were no URLs to parse
+            parent.lb_progress.config(text='')
+
+        if finished:
+            parent.btn_parse.config(text='Update database', state='normal')  # set buttons back to default
+            for button in (parent.btn_open_urls_file, parent.btn_edit_urls):
+                button.config(state='normal')
+            parent.btn_cancel.config(state='disabled')
+            if len(parent.item_list.name_index) != len(parent.pbase.items):  # new items were added
+                if not parent.item_list.get():
+                    cls.load_item_list(parent)
+                else:
+                    cls._set_names(parent)
+        else:
+            parent.after(100, lambda: cls._poll_update(parent, messages, state))
+
+
+    def cancel_update(parent):
+        ''' BUTTON: <Cancel>
+            Stop running update, prices parsed so far are kept. '''
+
+        if parent.update_cancel is not None:
+            parent.update_cancel.set()
+            parent.btn_cancel.config(state='disabled')
+            parent.lb_progress.config(text='Cancelling...')
 
 
     def delete_price(parent, event):
         ''' Delete selected price entry from table, ProductBase and mark for deletion from XML on exit. '''
 
-        price_to_delete = parent.prices.focus()
-        price_date = parent.prices.item(price_to_delete)['values'][0]
-        parent.prices.delete(price_to_delete)                   # delete from TreeView
+        index = parent.prices.focused_index()
+        item = parent.pbase.get_item(parent.selected)
+        if index is None or item is None:
+            return
+        price_date, price, last_seen = item.prices.item_at(index)
         parent.pbase.delete_price(parent.selected, price_date)  # delete from ProductBase
+        parent.prices.refresh(len(item.prices))                 # and show rows after it one row up
 
 
     def call_linkedit(parent):
         ''' Open Link Editor window. '''
+        from linkedit import LinkEditor
         LinkEditor()
         
 
     def browse(parent):
         ''' Open URL in default browser. '''
         if parent.current_url:  # not empty
+            import webbrowser as wb
             try:
                 wb.open(parent.current_url)
             except AttributeError:
@@ -0,0 +1,81 @@
+''' On-disk cache of HTTP validators for product pages, kept next to XML file.
+    For every URL stores ETag, Last-Modified and hash of the page body from previous run,
+    so next run can send conditional request and tell if page changed without parsing it.
+    Price saved for the page is stored too: unchanged page repeats latest price of file, so entry is valid
+    only while that is still the price (not deleted from file since). '''
+
+import hashlib
+import json
+import os
+import threading
+
+
+class ValidatorCache:
+    def __init__(self, filename):
+        self.filename = filename
+        self._entries = dict()  # url -> {'etag': ..., 'last_modified': ..., 'hash': ..., 'price': ...}
+        self._lock = threading.Lock()  # updated from parser worker threads
+
+        if os.path.isfile(filename):
+            try:
+                with open(filename, encoding='utf-8') as cache_file:
+                    self._entries = json.load(cache_file)
+            except ValueError:  # broken cache is not a problem, pages will be just downloaded again
+                self._entries = dict()
+
+    def headers(self, url):
+        ''' Headers for conditional request to URL, empty if nothing is known about it. '''
+
+        with self._lock:
+            entry = self._entries.get(url, {})
+        headers = dict()
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url, response):
+        ''' Remember validators of response (http_session.Response) and return True if page has changed:
+            not 304 Not Modified and body is different from previous run. '''
+
+        if response.status == 304:
+            return False
+
+        body_hash = hashlib.sha1(response.body).hexdigest()
+        with self._lock:
+            previous = self._entries.get(url, {})
+            self._entries[url] = {'etag': response.headers.get('ETag'),
+                                  'last_modified': response.headers.get('Last-Modified'),
+                                  'hash': body_hash}
+            if previous.get('hash') == body_hash and 'price' in previous:  # same page, same price
+                self._entries[url]['price'] = previous['price']
+        return previous.get('hash') != body_hash
+
+    def set_price(self, url, price):
+        ''' Remember price saved for page just downloaded. '''
+
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                entry['price'] = price
+
+    def price(self, url):
+        ''' Price saved for page when its validators were stored, None if unknown. '''
+
+        with self._lock:
+            return self._entries.get(url, {}).get('price')
+
+    def forget(self, url):
+        ''' Drop URL from cache, so it will be downloaded and parsed in full. '''
+
+        with self._lock:
+            self._entries.pop(url, None)
+
+    def save(self):
+        ''' Write cache to disk. Temporary file + rename, so cache is never left half-written. '''
+
+        with self._lock:
+            with open(self.filename + '.tmp', 'w', encoding='utf-8') as cache_file:
+                json.dump(self._entries, cache_file)
+        os.replace(self.filename + '.tmp', self.filename)
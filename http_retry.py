@@ -0,0 +1,129 @@
+''' Retries and circuit breaker for page downloads.
+    Failed request is repeated after exponentially growing random delay (full jitter, so parallel workers
+    don't retry all at once). Host which keeps failing is given a rest: circuit breaker makes requests to it
+    fail at once for a while instead of every one of them waiting for timeout and retries. '''
+
+import http.client
+import random
+import threading
+import time
+import urllib.parse as up
+
+import http_session
+import metrics
+
+
+RETRIES = 2          # repeats after first failed attempt
+BASE_DELAY = 0.5     # seconds before first retry, doubled for every next one
+MAX_DELAY = 10.0
+FAILURE_THRESHOLD = 5   # failures in a row which open circuit of host
+COOLDOWN = 60.0         # seconds host is not requested after that
+
+
+class CircuitOpenError(Exception):
+    ''' Host has failed too many times recently, request was not even sent. '''
+
+    def __init__(self, host):
+        super().__init__(f'{host} is failing, requests to it are paused')
+        self.host = host
+
+
+# everything that means page could not be downloaded (as opposed to bugs)
+FETCH_ERRORS = (OSError, http.client.HTTPException, http_session.HTTPError, CircuitOpenError)
+
+
+def is_transient(error):
+    ''' Whether request may succeed if repeated: network errors, timeouts, 5xx and 429, but not 404. '''
+
+    if isinstance(error, http_session.HTTPError):
+        return error.status >= 500 or error.status == 429
+    if isinstance(error, http.client.InvalidURL):  # wrong URL in file, repeating won't fix it
+        return False
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+class Retry:
+    ''' How many times and how long to wait before repeating failed request. '''
+
+    def __init__(self, retries=RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY, sleep=time.sleep):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    def delay(self, attempt):
+        ''' Seconds to wait before retry number attempt (0 is first retry). '''
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    ''' Per host: after threshold transient failures in a row circuit opens and requests to host raise
+        CircuitOpenError for cooldown seconds. Then one trial request is let through: if it succeeds,
+        circuit closes, if not, it opens again. Thread-safe, shared by all workers of one parse() run. '''
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._failures = dict()    # host -> transient failures in a row
+        self._open_until = dict()  # host -> time until which requests fail at once
+        self._lock = threading.Lock()
+
+    def before(self, url):
+        ''' Raise CircuitOpenError if host of URL must not be requested now. '''
+
+        host = up.urlsplit(url).netloc
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return
+            if self.clock() < open_until:
+                metrics.count('circuit_rejections')
+                raise CircuitOpenError(host)
+            # cooldown is over: this request is the trial, others wait for its result
+            self._open_until[host] = self.clock() + self.cooldown
+
+    def success(self, url):
+        host = up.urlsplit(url).netloc
+        with self._lock:
+            self._failures.pop(host, None)
+            self._open_until.pop(host, None)
+
+    def failure(self, url):
+        host = up.urlsplit(url).netloc
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.threshold:
+                self._open_until[host] = self.clock() + self.cooldown
+
+    def is_open(self, url):
+        with self._lock:
+            return up.urlsplit(url).netloc in self._open_until
+
+
+def call(function, url, retry=None, breaker=None):
+    ''' Return function(url), repeating it on transient errors as retry says.
+        Breaker is told about every attempt and may stop them early. '''
+
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before(url)
+        try:
+            result = function(url)
+        except FETCH_ERRORS as error:
+            if not is_transient(error):  # 404 and such: page is wrong, not host
+                if breaker is not None:
+                    breaker.success(url)
+                raise
+            if breaker is not None:
+                breaker.failure(url)
+            if retry is None or attempt >= retry.retries or (breaker is not None and breaker.is_open(url)):
+                raise
+            metrics.count('retries')
+            retry.sleep(retry.delay(attempt))
+            attempt += 1
+        else:
+            if breaker is not None:
+                breaker.success(url)
+            return result
@@ -0,0 +1,306 @@
+''' Shared HTTP session for tcxml, LinkEditor and GUI.
+    Keeps connections to the site open between requests (keep-alive) and reuses one SSL context,
+    so parsing many pages from one host doesn't pay a TCP+TLS handshake for every page. '''
+
+import gzip
+import http.client
+import ssl
+import threading
+import urllib.parse as up
+import zlib
+
+import metrics
+
+
+USER_AGENT = 'Magic Browser'
+MAX_REDIRECTS = 5
+MAX_IDLE_PER_HOST = 8  # connections kept open per host, should be >= tcxml.MAX_WORKERS
+STREAM_CHUNK = 16384   # bytes of (decompressed) body given to consumer at once
+DRAIN_LIMIT = 262144   # when consumer stops early, read up to that much of the rest to keep connection alive:
+                       # that's about what downloads in the time of new TCP+TLS handshake (~100 ms at 2.5 MB/s),
+                       # larger rest is cheaper to drop together with connection than to download
+CONNECT_TIMEOUT = 10.0 # seconds to open connection (TCP and TLS handshake)
+READ_TIMEOUT = 30.0    # seconds to wait for any data from server after that
+
+# errors which mean that kept-alive connection was closed by server while idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                           ConnectionResetError, BrokenPipeError)
+
+
+class HTTPError(Exception):
+    ''' Server answered with error status (4xx, 5xx). '''
+
+    def __init__(self, url, status, reason=''):
+        super().__init__(f'HTTP {status} {reason} at {url}')
+        self.url = url
+        self.status = status
+
+
+class Response:
+    ''' Finished request: status, headers and body (already decompressed). '''
+
+    def __init__(self, url, status, headers, body):
+        self.url = url          # final URL, after redirects
+        self.status = status
+        self.headers = headers  # http.client.HTTPMessage, case-insensitive
+        self.body = body        # bytes
+
+
+_ssl_context = None
+_init_lock = threading.Lock()
+
+
+def ssl_context():
+    ''' Creating context loads all CA certificates, so it's done once and shared.
+        Certificates are not checked (ignore ssl), as it always was in this program. '''
+
+    global _ssl_context
+    with _init_lock:
+        if _ssl_context is None:
+            ctx = ssl.create_default_context()
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+            _ssl_context = ctx
+    return _ssl_context
+
+
+def decode_body(body, encoding):
+    ''' Decompress body according to Content-Encoding header. '''
+
+    encoding = (encoding or '').lower()
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:  # some servers send raw deflate without zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def _decompressor(encoding, first_bytes):
+    ''' Object with decompress() and flush() for streamed body, None if body is not compressed. '''
+
+    encoding = (encoding or '').lower()
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':  # zlib stream starts with 0x78, otherwise it's raw deflate
+        return zlib.decompressobj(zlib.MAX_WBITS if first_bytes[:1] == b'\x78' else -zlib.MAX_WBITS)
+    return None
+
+
+class Session:
+    ''' Pool of keep-alive connections, one list of idle connections per (scheme, host, port).
+        Thread-safe: each request takes a connection out of the pool and puts it back when done. '''
+
+    def __init__(self, compress=True, max_idle_per_host=MAX_IDLE_PER_HOST,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.compress = compress  # ask server for gzip/deflate
+        self.max_idle_per_host = max_idle_per_host
+        self.connect_timeout = connect_timeout  # hung connection raises TimeoutError instead of blocking forever
+        self.read_timeout = read_timeout
+        self._idle = dict()       # (scheme, host, port) -> list of idle connections
+        self._lock = threading.Lock()
+
+        # counters, used by bench.py
+        self.requests = 0
+        self.connections_opened = 0  # every one is a TCP (and TLS) handshake
+        self.bytes_received = 0      # bodies as they came over network, before decompression
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        with self._lock:
+            self.connections_opened += 1
+        metrics.count('connections')
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.connect_timeout, context=ssl_context())
+        return http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+
+    def _request(self, conn, path, headers):
+        if conn.sock is None:  # connect with connect timeout, then wait for data with read timeout
+            with metrics.timer('connect'):  # DNS + TCP + TLS handshake
+                conn.connect()
+            conn.sock.settimeout(self.read_timeout)
+        with metrics.timer('response_wait'):  # until status and headers are received
+            conn.request('GET', path, headers=headers)
+            return conn.getresponse()
+
+    def _take_connection(self, key):
+        ''' Returns (connection, reused). '''
+
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(key), False
+
+    def _release_connection(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, key, path, headers):
+        ''' Send request over pooled connection, returns (connection, http.client.HTTPResponse).
+            If reused connection turns out to be closed by server, retry once on a new one. '''
+
+        conn, reused = self._take_connection(key)
+        try:
+            return conn, self._request(conn, path, headers)
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+        except BaseException:  # timeout and such: connection is in unknown state
+            conn.close()
+            raise
+        conn = self._new_connection(key)
+        try:
+            return conn, self._request(conn, path, headers)
+        except BaseException:
+            conn.close()
+            raise
+
+    def _stream(self, resp, consumer):
+        ''' Give decompressed body to consumer in STREAM_CHUNK pieces until it returns True.
+            Body is downloaded piece by piece. When consumer stops, rest of body up to DRAIN_LIMIT is read,
+            so connection is kept; longer rest is not downloaded and connection is closed.
+            Returns (part of body given to consumer, whether connection can be reused). '''
+
+        decompressor = None
+        first = True
+        pending = bytearray()  # decompressed data, not yet given to consumer
+        consumed = []
+        received = 0
+        stopped = False
+        try:
+            while not stopped:
+                raw = resp.read(STREAM_CHUNK)
+                if not raw:
+                    if decompressor is not None:
+                        pending += decompressor.flush()
+                    break
+                received += len(raw)
+                if first:
+                    decompressor = _decompressor(resp.getheader('Content-Encoding'), raw)
+                    first = False
+                pending += decompressor.decompress(raw) if decompressor is not None else raw
+
+                # chunks always have the same size, so consumed part of the same page is always the same
+                while len(pending) >= STREAM_CHUNK and not stopped:
+                    chunk = bytes(pending[:STREAM_CHUNK])
+                    del pending[:STREAM_CHUNK]
+                    consumed.append(chunk)
+                    stopped = consumer(chunk)
+
+            while pending and not stopped:  # end of body
+                chunk = bytes(pending[:STREAM_CHUNK])
+                del pending[:STREAM_CHUNK]
+                consumed.append(chunk)
+                stopped = consumer(chunk)
+
+            reusable = True
+            if stopped and not resp.isclosed():
+                reusable = False
+                if not resp.will_close and (resp.length is None or resp.length <= DRAIN_LIMIT):
+                    drained = 0  # length of chunked body is unknown, read it up to the limit
+                    while drained <= DRAIN_LIMIT and not resp.isclosed():
+                        raw = resp.read(STREAM_CHUNK)
+                        if not raw:
+                            break
+                        drained += len(raw)
+                    received += drained
+                    reusable = resp.isclosed()  # whole rest is read
+        finally:
+            with self._lock:
+                self.bytes_received += received
+            metrics.count('bytes_fetched', received)
+
+        return b''.join(consumed), reusable
+
+    def get(self, url, headers=None, consumer=None):
+        ''' GET url following redirects, returns Response. Raises HTTPError on 4xx/5xx.
+            If consumer is given, page body is given to it in chunks until consumer(chunk) returns True,
+            the rest is read only if it's short (see _stream()); Response.body is then only the part
+            of page consumer has seen. '''
+
+        request_headers = {'User-Agent': USER_AGENT}
+        if self.compress:
+            request_headers['Accept-Encoding'] = 'gzip, deflate'
+        request_headers.update(headers or {})
+
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = up.urlsplit(url)
+            try:
+                key = (parts.scheme, parts.hostname, parts.port)  # port which is not a number raises ValueError
+            except ValueError as error:
+                raise http.client.InvalidURL(f'{error}: {url!r}') from None
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise http.client.InvalidURL(f'not an http(s) URL with host: {url!r}')
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            conn, resp = self._send(key, path, request_headers)
+            stream = consumer is not None and 200 <= resp.status < 300  # redirects and errors are read whole
+            try:
+                with metrics.timer('body'):  # download, decompression and streaming consumer
+                    if stream:
+                        body, reusable = self._stream(resp, consumer)
+                    else:
+                        body, reusable = resp.read(), True  # must read whole response before connection can be reused
+                        with self._lock:
+                            self.bytes_received += len(body)
+                        metrics.count('bytes_fetched', len(body))
+            except BaseException:
+                conn.close()
+                raise
+            with self._lock:
+                self.requests += 1
+            metrics.count('requests')
+
+            if resp.will_close or not reusable:
+                conn.close()
+            else:
+                self._release_connection(key, conn)
+
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader('Location'):
+                url = up.urljoin(url, resp.getheader('Location'))
+                continue
+            if resp.status >= 400:
+                raise HTTPError(url, resp.status, resp.reason)
+
+            if not stream:
+                body = decode_body(body, resp.getheader('Content-Encoding'))
+            return Response(url, resp.status, resp.headers, body)
+
+        raise HTTPError(url, resp.status, 'too many redirects')
+
+    def close(self):
+        ''' Close all idle connections. '''
+
+        with self._lock:
+            idle, self._idle = self._idle, dict()
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+
+_default_session = None
+
+
+def default_session():
+    ''' Session shared by the whole program. '''
+
+    global _default_session
+    with _init_lock:
+        if _default_session is None:
+            _default_session = Session()
+    return _default_session
+
+
+def get(url, headers=None, consumer=None):
+    ''' GET url with shared session. '''
+    return default_session().get(url, headers, consumer)
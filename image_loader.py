@@ -0,0 +1,159 @@
+''' Loads product images for GUI without blocking it.
+    Images are downloaded and resized on worker threads; results are passed back to Tk main thread
+    through a queue polled with after(), since Tk objects can only be touched from main thread.
+    Two cache levels: resized PhotoImages in memory (LRU) and resized thumbnails on disk, keyed by image URL,
+    so images are downloaded once, not on every selection of item.
+    PIL and network stack are imported with first image, not at start of GUI. '''
+
+import concurrent.futures as cf
+import hashlib
+import os
+import queue
+from collections import OrderedDict
+from io import BytesIO
+
+
+IMAGE_SIZE = 382         # images are resized to fit IMAGE_SIZE x IMAGE_SIZE px square
+CACHE_DIR = 'thumbnails'
+MEMORY_CACHE_SIZE = 64   # PhotoImages kept in memory
+WORKERS = 2
+POLL_INTERVAL = 30       # ms between checks for loaded images
+
+
+def resize_image(image, new_size):
+    ''' Calculate new image size and return Image object on white square background. '''
+
+    from PIL import Image
+
+    size_x, size_y = image.size
+    if size_x >= size_y:
+        k = size_x / new_size
+        new_size_x = new_size
+        new_size_y = int(size_y // k)
+    else:
+        k = size_y / new_size
+        new_size_y = new_size
+        new_size_x = int(size_x // k)
+
+    resized = image.resize((new_size_x, new_size_y))
+
+    # create white background for image to exactly fit square
+    bg = Image.new('RGBA', (new_size, new_size), (255, 255, 255, 255))
+    offset = ((new_size - new_size_x) // 2, (new_size - new_size_y) // 2)  # paste to center
+    bg.paste(resized, offset)
+
+    return bg
+
+
+def open_photo(filename):
+    ''' PhotoImage of image file, e.g. of placeholder shown while item has no image. '''
+
+    from PIL import ImageTk
+    return ImageTk.PhotoImage(file=filename)
+
+
+class ImageLoader:
+    ''' Usage:  loader = ImageLoader(tk_root)
+                loader.request(url, callback)  # callback(PhotoImage or None) is called on main thread
+                loader.prefetch([url, ...])    # load into cache for later requests '''
+
+    def __init__(self, widget, size=IMAGE_SIZE, cache_dir=CACHE_DIR, memory_size=MEMORY_CACHE_SIZE):
+        self.widget = widget  # any Tk widget, for after()
+        self.size = size
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self._memory = OrderedDict()  # url -> PhotoImage, least recently used first
+        self._pending = dict()        # url -> callbacks waiting for it; loads are started once per URL
+        self._results = queue.Queue() # (url, resized Image or None) from workers
+        self._polling = False
+        self._pool = cf.ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='image_loader')
+
+    def _cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.png')
+
+    def _load(self, url):
+        ''' Worker thread: resized image from disk cache or from site, None if it can't be loaded. '''
+
+        import http_retry
+        import http_session
+        from PIL import Image
+
+        path = self._cache_path(url)
+        try:
+            if os.path.isfile(path):
+                image = Image.open(path)
+                image.load()  # read now, on worker thread
+                return image
+
+            image = resize_image(Image.open(BytesIO(http_session.get(url).body)), self.size)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            image.save(path + '.tmp', format='PNG')  # temporary file + rename, so no half-written thumbnails
+            os.replace(path + '.tmp', path)
+            return image
+        except http_retry.FETCH_ERRORS + (ValueError, Image.DecompressionBombError):
+            return None  # no network, broken or too large image: item is shown without it
+
+    def _worker(self, url):
+        image = None
+        try:
+            image = self._load(url)
+        finally:  # result must come even if loading failed otherwise: _poll() runs until every URL has it
+            self._results.put((url, image))
+
+    def _start(self, url, callback=None):
+        if url in self._pending:
+            if callback is not None:
+                self._pending[url].append(callback)
+            return
+        self._pending[url] = [callback] if callback is not None else []
+        self._pool.submit(self._worker, url)
+        if not self._polling:
+            self._polling = True
+            self.widget.after(POLL_INTERVAL, self._poll)
+
+    def _poll(self):
+        ''' Main thread: turn loaded images into PhotoImages and give them to callbacks. '''
+
+        while True:
+            try:
+                url, image = self._results.get_nowait()
+            except queue.Empty:
+                break
+            photo = None
+            if image is not None:
+                from PIL import ImageTk
+                photo = ImageTk.PhotoImage(image)
+                self._remember(url, photo)
+            for callback in self._pending.pop(url, []):
+                callback(photo)
+
+        self._polling = bool(self._pending)
+        if self._polling:
+            self.widget.after(POLL_INTERVAL, self._poll)
+
+    def _remember(self, url, photo):
+        self._memory[url] = photo
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def request(self, url, callback):
+        ''' Call callback with PhotoImage of url: at once if it's in memory, otherwise when it's loaded. '''
+
+        photo = self._memory.get(url)
+        if photo is not None:
+            self._memory.move_to_end(url)
+            callback(photo)
+        else:
+            self._start(url, callback)
+
+    def prefetch(self, urls):
+        ''' Start loading images which are likely to be requested soon. '''
+
+        for url in urls:
+            if url and url not in self._memory:
+                self._start(url)
+
+    def close(self):
+        ''' Drop loads not started yet. '''
+        self._pool.shutdown(wait=False, cancel_futures=True)
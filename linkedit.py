@@ -1,16 +1,34 @@
-import codecs
+import concurrent.futures as cf
 import os.path
-import ssl
+import queue
 import tkinter as tk
 import tkinter.messagebox as mbox
 import tkinter.filedialog as fd
-import urllib.request as ur
-import webbrowser as wb
 import xml.etree.ElementTree as et
 
 from tkinter.ttk import Treeview, Scrollbar, Button
 
-import tcxml
+# tcxml (with network stack), storage and webbrowser are imported when first needed,
+# so window opens without waiting for them
+
+
+NAME_NOT_FOUND = 'Item not found, possibly wrong URL'
+RESOLVING = 'Checking...'
+POLL_INTERVAL = 100  # ms between batches of resolved names put into table
+
+
+def resolve_name(url, limiter=None):
+    ''' Item name from product page, NAME_NOT_FOUND if there is none or page can't be loaded.
+        Runs in worker threads, so must not touch widgets. '''
+
+    import http_retry
+    import tcxml
+
+    try:
+        item_data = tcxml.parse_url(url, limiter)  # stops parsing as soon as name is found
+    except http_retry.FETCH_ERRORS:
+        return NAME_NOT_FOUND
+    return item_data.name or NAME_NOT_FOUND
 
 
 class LinkEditor(tk.Toplevel):
@@ -57,6 +75,9 @@ class LinkEditor(tk.Toplevel):
         self.btn_save = Button(self.buttons_frame, text='Save list', command=self.save_xml)
         self.btn_save.pack(side='left', padx=10)
 
+        self.btn_revalidate = Button(self.buttons_frame, text='Re-validate', command=self.revalidate)
+        self.btn_revalidate.pack(side='left')
+
         self.btn_cancel = Button(self.buttons_frame, text='Close', command=self.close)
         self.btn_cancel.pack(side='right')
         
@@ -67,10 +88,19 @@ class LinkEditor(tk.Toplevel):
         self.bind('<Return>', self.add_url)
         self.is_saved = True  # sets to False when changes are made and to True when Save button is pressed
 
+        # names of URLs are checked by worker threads, results are put into table by _poll() on main thread
+        self._pool = None
+        self._limiter = None  # tcxml.RateLimiter, made with pool
+        self._resolved = queue.Queue()  # (table row, name)
+        self._unresolved = 0
+        self._poll_id = None
+
 
     def add_url(self, event=''):  # empty event if adding by button
         ''' Check entered URL for validity and if valid, add to list (Treeview). '''
 
+        import tcxml
+
         url = self.entry.get()
         self.btn_add.config(text='Checking...')
         self.btn_add.update()
@@ -92,7 +122,7 @@ class LinkEditor(tk.Toplevel):
         else:  # add url and name to table
 
             self.url_list.insert('', index='end', 
-                                 values=(url, name if name != '' else 'Item not found, possibly wrong URL'))
+                                 values=(url, name if name != '' else NAME_NOT_FOUND))
             self.entry.delete(0, 'end')
         finally:
             self.btn_add.config(text='Add link')
@@ -101,7 +131,8 @@ class LinkEditor(tk.Toplevel):
 
 
     def load_xml(self):
-        ''' Load URLs from file and put into TreeView list. '''
+        ''' Load URLs from file and put into TreeView list.
+            Names stored in file are shown as they are, only URLs without name are checked on the site. '''
         
         # show standard Open File dialog
         xml_filename = fd.askopenfilename(title='Open XML',
@@ -112,27 +143,85 @@ class LinkEditor(tk.Toplevel):
         for item in self.url_list.get_children():  # clear table
             self.url_list.delete(item)        
 
-        data = et.parse(xml_filename)
-        root = data.getroot()
-        urls = [element.text for element in root.findall('item/url')]
+        import storage
+        store = storage.open_storage(xml_filename)  # also sees items added by tcxml which are still in journal
+        try:
+            items = [(record.url, record.name.strip()) for record in store.load_items(keep_last=1) if record.url]
+        finally:
+            store.close()
+
+        unresolved = []
+        for url, name in items:
+            row = self.url_list.insert('', index='end', values=(url, name or RESOLVING))
+            if not name:
+                unresolved.append(row)
+        self._resolve(unresolved)
+
+
+    def revalidate(self):
+        ''' BUTTON: <Re-validate>
+            Check every URL in list on the site again and show names as they are there now. '''
+
+        rows = self.url_list.get_children()
+        for row in rows:
+            self.url_list.set(row, 'col2', RESOLVING)
+        self._resolve(rows)
 
-        total_urls = len(urls)
-        for n in range(total_urls):
-            url = urls[n]
-            self.title(f'Link editor - Loading URL {n+1} of {total_urls}...')  # show links counter in window title
-            
-            name = tcxml.get_item_name(tcxml.open_url(url))
-            self.url_list.insert('', index='end',
-                                 values=(url, name if name != '' else 'Item not found, possibly wrong URL'))
-            self.url_list.update()
-            
-        self.title('Link editor')  # reset window title
+
+    def _resolve(self, rows):
+        ''' Get names for table rows from their pages in worker threads. '''
+
+        if not rows:
+            return
+        if self._pool is None:
+            import tcxml  # here, not in worker threads
+            self._pool = cf.ThreadPoolExecutor(max_workers=tcxml.MAX_WORKERS)
+            self._limiter = tcxml.RateLimiter()
+
+        for row in rows:
+            url = self.url_list.set(row, 'col1')
+            self._pool.submit(self._resolve_row, row, url)
+        self._unresolved += len(rows)
+        self.title(f'Link editor - Checking {self._unresolved} URLs...')  # show links counter in window title
+
+        if self._poll_id is None:
+            self._poll_id = self.after(POLL_INTERVAL, self._poll)
+
+
+    def _resolve_row(self, row, url):
+        ''' Worker thread: put name of row into queue, NAME_NOT_FOUND if checking failed unexpectedly. '''
+
+        name = NAME_NOT_FOUND
+        try:
+            name = resolve_name(url, self._limiter)
+        finally:  # every row must report back, _poll() runs until all of them have
+            self._resolved.put((row, name))
+
+
+    def _poll(self):
+        ''' Put names resolved since last call into table, all at once. '''
+
+        while True:
+            try:
+                row, name = self._resolved.get_nowait()
+            except queue.Empty:
+                break
+            self._unresolved -= 1
+            if self.url_list.exists(row):  # may have been deleted meanwhile
+                self.url_list.set(row, 'col2', name)
+
+        if self._unresolved:
+            self.title(f'Link editor - Checking {self._unresolved} URLs...')
+            self._poll_id = self.after(POLL_INTERVAL, self._poll)
+        else:
+            self.title('Link editor')  # reset window title
+            self._poll_id = None
 
 
     def save_xml(self):
         ''' Save current url list to XML file. This file will be used by tcxml.py to get urls from.
         a) If file exists, check if url is in there
-            i)  If it is, do nothing, skip to next url
+            i)  If it is, fill in its name if it's empty (name was still being checked when it was saved)
             ii) Else add new <item> block
         b) Else create XML with structure like this:
             <root>
@@ -149,19 +238,27 @@ class LinkEditor(tk.Toplevel):
             xml_filename += '.xml'
 
         if os.path.isfile(xml_filename):    # file exists
+            import storage
+            storage.compact(xml_filename)   # fold journal into file, so items tcxml has added are in it
             data = et.parse(xml_filename)
             root = data.getroot()
             for element in root.iter():
                 print(element.tag)
                 print('----')
             
-            urls = [url.text for url in root.findall('item/url')]
+            items = dict()  # url -> first <item> with it
+            for item in root.findall('item'):
+                items.setdefault(item.findtext('url'), item)
 
             for entry in self.url_list.get_children():  # search for urls
                 entry_url = self.url_list.item(entry)['values'][0]
-                if entry_url not in urls:   # item was not added before
-                    new_item = et.SubElement(root, 'item', name=self.url_list.item(entry)['values'][1])
+                item_name = self._entry_name(entry)
+                item = items.get(entry_url)
+                if item is None:   # item was not added before
+                    new_item = et.SubElement(root, 'item', name=item_name)
                     et.SubElement(new_item, 'url').text = entry_url
+                elif item_name and not item.get('name', '').strip():  # name is known now
+                    item.set('name', item_name)
                 
 
         else:                               # file does not exist
@@ -169,7 +266,7 @@ class LinkEditor(tk.Toplevel):
             root = et.Element('root')
             for entry in self.url_list.get_children():  # search for urls
                 url = self.url_list.item(entry)['values'][0]
-                item_name = self.url_list.item(entry)['values'][1]
+                item_name = self._entry_name(entry)
                 new_item = et.SubElement(root, 'item', name=item_name)
                 et.SubElement(new_item, 'url').text = url
 
@@ -180,6 +277,21 @@ class LinkEditor(tk.Toplevel):
         self.is_saved = True
 
 
+    def _entry_name(self, entry):
+        ''' Name of table row to save, empty if it's still being checked (it will be checked on next load
+            and saved into existing item then). '''
+        name = self.url_list.item(entry)['values'][1]
+        return name if name != RESOLVING else ''
+
+
+    def destroy(self):
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)  # names are not needed any more
+        super().destroy()
+
+
     def close(self):
         ''' Close window. '''
         if self.is_saved:
@@ -212,6 +324,7 @@ class LinkEditor(tk.Toplevel):
 
     def open_url(self):
         ''' Popup menu command. Open selected item's URL in default browser. '''
+        import webbrowser as wb
         wb.open(self.url_list.item(self.current_item)['values'][0])
 
 
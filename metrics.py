@@ -0,0 +1,146 @@
+''' Timings and counters of one parser run, to see where time goes: connecting (DNS + TCP + TLS),
+    waiting for server, downloading body, extraction, writing file, retries.
+    Disabled by default: then timer() returns a shared do-nothing object and count()/observe() return at once,
+    so instrumented code costs about one function call. Enabled by tcxml.parse(metrics_file=...).
+
+    Usage:  with metrics.timer('parse_url'): ...
+            metrics.count('bytes_fetched', len(body))
+            metrics.write('run.prom')   # Prometheus text format, or JSON for any other extension '''
+
+import json
+import math
+import os
+import threading
+import time
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = 'tcxml'  # of Prometheus metric names
+
+enabled = False
+_samples = dict()   # timer name -> [seconds]
+_counters = dict()  # counter name -> number
+_lock = threading.Lock()  # timers are used from worker threads
+
+
+class _Timer:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.started)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Accumulator:
+    ''' Wraps function and sums time spent in it over several calls,
+        e.g. extractor fed with page in chunks, then observed as one sample. '''
+
+    def __init__(self, function):
+        self.function = function
+        self.seconds = 0.0
+
+    def __call__(self, *args):
+        started = time.perf_counter()
+        try:
+            return self.function(*args)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    ''' Forget everything measured, for next run. '''
+
+    with _lock:
+        _samples.clear()
+        _counters.clear()
+
+
+def timer(name):
+    ''' Context manager which adds time of its block to timer name. '''
+    return _Timer(name) if enabled else _NULL_TIMER
+
+
+def observe(name, seconds):
+    if enabled:
+        with _lock:
+            _samples.setdefault(name, []).append(seconds)
+
+
+def count(name, value=1):
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def _quantile(ordered, q):
+    ''' Nearest-rank quantile of sorted list. '''
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def snapshot():
+    ''' {'timers': {name: {'count', 'sum', 'max', 'p50', 'p95', 'p99'}}, 'counters': {name: value}} '''
+
+    with _lock:
+        samples = {name: sorted(values) for name, values in _samples.items()}
+        counters = dict(_counters)
+
+    timers = dict()
+    for name, ordered in samples.items():
+        timers[name] = {'count': len(ordered), 'sum': sum(ordered), 'max': ordered[-1]}
+        for q in QUANTILES:
+            timers[name][f'p{q * 100:g}'] = _quantile(ordered, q)
+    return {'timers': timers, 'counters': counters}
+
+
+def prometheus_text(data=None):
+    ''' Snapshot in Prometheus text exposition format: timers as summaries, counters as counters. '''
+
+    data = data or snapshot()
+    lines = []
+    for name, timer_data in sorted(data['timers'].items()):
+        metric = f'{PREFIX}_{name}_seconds'
+        lines.append(f'# TYPE {metric} summary')
+        for q in QUANTILES:
+            lines.append(f'{metric}{{quantile="{q:g}"}} {timer_data[f"p{q * 100:g}"]:.6f}')
+        lines.append(f'{metric}_sum {timer_data["sum"]:.6f}')
+        lines.append(f'{metric}_count {timer_data["count"]}')
+    for name, value in sorted(data['counters'].items()):
+        metric = f'{PREFIX}_{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write(filename):
+    ''' Write snapshot to file: Prometheus text format if it ends with .prom (for node_exporter textfile
+        collector), JSON otherwise. Temporary file + rename, so collector never reads half-written file. '''
+
+    data = snapshot()
+    with open(filename + '.tmp', 'w', encoding='utf-8') as metrics_file:
+        if filename.endswith('.prom'):
+            metrics_file.write(prometheus_text(data))
+        else:
+            json.dump(data, metrics_file, indent=2)
+    os.replace(filename + '.tmp', filename)
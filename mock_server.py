@@ -0,0 +1,187 @@
+''' Local stand-in for TopComputer.Ru, used by bench.py.
+    Serves generated product pages at /tovary/<slug>/ over HTTP/1.1 with keep-alive
+    and counts TCP connections it accepted (every one would be a TLS handshake on the real site).
+    Category listing /catalog/<category>/?PAGEN_1=<page> lists products <category>-0, <category>-1, ...
+    Can also be slow (latency) or flaky: answer some requests with 503 or hang on them, to try retries and timeouts. '''
+
+import functools
+import gzip
+import http.server
+import random
+import sys
+import threading
+import time
+import urllib.parse as up
+import zlib
+
+
+PAGE_SIZE = 150_000  # approx. size of real product page, bytes
+LISTING_PAGE_SIZE = 40  # products on one page of category listing
+CATEGORY_SIZE = 1000    # products in every category
+
+
+def product_page(slug, price, size=PAGE_SIZE):
+    ''' HTML of product page with the same markers as on the real site. price=None means not in stock. '''
+
+    head = (f'<!DOCTYPE html><html><head><meta charset="utf-8">'
+            f'<title>Процессор {slug} купить в Москве</title></head><body>'
+            + '<nav><a href="/catalog/">Каталог</a></nav>\n' * 50 +  # menus before product card
+            f'<div class="product-image"><img src="/upload/iblock/{slug}.jpg" class="fbox-product-image"></div>'
+            f'<h1 class="product-title" itemprop="name">Процессор {slug}</h1>')
+    if price is not None:
+        head += f'<meta itemprop="price" content="{price}">'
+    # rest of page: menus, scripts, reviews; random words so it compresses about as well as real HTML
+    rnd = random.Random(slug)
+    words = [''.join(rnd.choice('абвгдежзиклмнопрстуфхцчшщэюяabcdefghijklmnopqrstuvwxyz0123456789')
+                     for _ in range(rnd.randint(2, 9))) for _ in range(400)]
+    filler = []
+    filled = len(head.encode('utf-8'))
+    while filled < size:
+        line = f'<div class="description">{" ".join(rnd.choices(words, k=12))}</div>\n'
+        filler.append(line)
+        filled += len(line.encode('utf-8'))
+    return (head + ''.join(filler) + '</body></html>').encode('utf-8')
+
+
+def listing_page(category, page, page_size=LISTING_PAGE_SIZE, category_size=CATEGORY_SIZE):
+    ''' HTML of category listing page: product cards with schema.org microdata, link to next page. '''
+
+    first = (page - 1) * page_size
+    slugs = [f'{category}-{n}' for n in range(first, min(first + page_size, category_size))]
+    html = [f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Процессоры {page}</title>']
+    if first + page_size < category_size:
+        html.append(f'<link rel="next" href="/catalog/{category}/?PAGEN_1={page + 1}">')
+    html.append('</head><body>' + '<nav><a href="/catalog/">Каталог</a></nav>\n' * 50)
+    for slug in slugs:
+        html.append(f'<div class="product-card" itemscope itemtype="http://schema.org/Product">'
+                    f'<a href="/tovary/{slug}/"><img src="/upload/iblock/{slug}.jpg"></a>'
+                    f'<a class="product-card__name" href="/tovary/{slug}/"><span itemprop="name">Процессор {slug}</span></a>'
+                    f'<div itemprop="offers" itemscope itemtype="http://schema.org/Offer">'
+                    f'<meta itemprop="price" content="{slug_price(slug)}"></div></div>\n')
+    html.append('</body></html>')
+    return ''.join(html).encode('utf-8')
+
+
+def slug_price(slug):
+    ''' Stable price for product, so repeated runs over the same page give the same data. '''
+    return random.Random(slug).randrange(5_000, 100_000)
+
+
+class ShopHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True  # otherwise headers and body written separately wait for delayed ACK
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+
+        path, _, query = self.path.partition('?')
+        parts = path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] not in ('tovary', 'catalog'):
+            self.send_error(404)
+            return
+        if parts[0] == 'catalog':
+            page = int(up.parse_qs(query).get('PAGEN_1', ['1'])[0])
+            parts[1] = f'{parts[1]}?{page}'  # page() key of listing
+
+        if self.server.latency:
+            time.sleep(self.server.latency)  # network round trips and server time of real site
+        with self.server.lock:
+            chance = self.server.random.random()
+        if chance < self.server.error_rate:
+            with self.server.lock:
+                self.server.errors += 1
+            self.send_error(503)
+            return
+        if chance < self.server.error_rate + self.server.hang_rate:
+            with self.server.lock:
+                self.server.hangs += 1
+            time.sleep(self.server.hang_time)  # longer than client timeout, client gives up
+
+        body = self.server.page(parts[1])
+        etag = f'"{zlib.crc32(body):08x}"'
+        if self.server.etags and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if self.server.etags:
+            self.send_header('ETag', etag)
+        if self.server.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = self.server.page(parts[1], compressed=True)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # no output for every request
+        pass
+
+
+class MockShop(http.server.ThreadingHTTPServer):
+    ''' Usage:  with MockShop() as shop:  shop.url('some-cpu') ... '''
+
+    daemon_threads = True
+    request_queue_size = 128  # default 5 drops connections from parallel workers, and they retry only after 1 s
+
+    def __init__(self, port=0, page_size=PAGE_SIZE, etags=True, gzip=False,
+                 error_rate=0.0, hang_rate=0.0, hang_time=5.0, seed=None, latency=0.0):
+        super().__init__(('127.0.0.1', port), ShopHandler)
+        self.page_size = page_size
+        self.etags = etags    # send ETag and answer 304 to matching If-None-Match
+        self.gzip = gzip      # compress pages if client accepts it
+        self.latency = latency        # seconds before every page is answered
+        self.error_rate = error_rate  # part of page requests answered with 503
+        self.hang_rate = hang_rate    # part of page requests answered only after hang_time seconds
+        self.hang_time = hang_time
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0  # accepted TCP connections
+        self.requests = 0
+        self.errors = 0       # requests answered with 503
+        self.hangs = 0
+
+    @functools.lru_cache(maxsize=1024)  # generating page takes longer than serving it
+    def page(self, slug, compressed=False):
+        ''' Product page, or listing page if slug is '<category>?<page number>'. '''
+
+        if compressed:
+            return gzip.compress(self.page(slug))
+        if '?' in slug:
+            category, page = slug.split('?')
+            return listing_page(category, int(page))
+        return product_page(slug, slug_price(slug), self.page_size)
+
+    def handle_error(self, request, client_address):
+        ''' Client dropping connection in the middle of page (streaming download stopped early) is normal. '''
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def url(self, slug):
+        return f'http://127.0.0.1:{self.server_address[1]}/tovary/{slug}/'
+
+    def listing_url(self, category):
+        return f'http://127.0.0.1:{self.server_address[1]}/catalog/{category}/'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    with MockShop(port=8000) as shop:
+        print(f'Serving at {shop.url("<slug>")}, press Enter to stop')
+        input()
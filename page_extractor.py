@@ -0,0 +1,182 @@
+''' Extracts item data (name, price, image link, info) from TopComputer.Ru product page.
+    Works on raw bytes in one pass: one compiled regex finds all markers, and every field
+    is cut from a small window around its marker, so the page is never decoded or sliced as a whole.
+    Can be fed page in chunks and tells when all fields are found, so download can be stopped early.
+    extract_listing() gets name and price of every product on category or search listing page. '''
+
+import re
+import urllib.parse as up
+from typing import NamedTuple
+
+
+SITE = 'https://topcomputer.ru/'
+NOT_IN_STOCK = 'NOT IN STOCK'
+
+NAME_WINDOW = 100     # characters after name marker where </h1> must be
+PRICE_WINDOW = 7      # characters after price marker where closing quote must be
+IMAGE_WINDOW = 200    # bytes before image marker which contain image link
+CHUNK_SIZE = 16384
+
+MARKERS = {b'<title>': 'info',
+           b'class="product-title" itemprop="name">': 'name',
+           b'itemprop="price" content="': 'price',
+           b'class="fbox-product-image': 'image_link'}
+MARKERS_RE = re.compile(b'|'.join(re.escape(marker) for marker in MARKERS))
+LONGEST_MARKER = max(len(marker) for marker in MARKERS)
+
+# listing page: every product card is schema.org Product microdata
+CARD_RE = re.compile(rb'itemtype="https?://schema\.org/Product"')
+CARD_LINK_RE = re.compile(rb'href="([^"]*/tovary/[^"]+)"')
+CARD_NAME_RE = re.compile(rb'itemprop="name"[^>]*>([^<]*)<')
+CARD_PRICE_RE = re.compile(rb'itemprop="price" content="([^"]*)"')  # same as on product page
+NEXT_PAGE_RE = re.compile(rb'<link rel="next" href="([^"]+)"')
+
+
+class ItemData(NamedTuple):
+    name: str
+    price: str        # digits as on page or NOT_IN_STOCK
+    image_link: str   # empty if not found
+    info: str         # page title
+
+
+class ListingEntry(NamedTuple):
+    url: str          # absolute URL of product page
+    name: str
+    price: str        # digits as on page or NOT_IN_STOCK
+
+
+def _decode(data):
+    return data.decode('utf-8', errors='ignore')
+
+
+class PageExtractor:
+    ''' Usage:  extractor = PageExtractor()
+                for chunk in response:
+                    if extractor.feed(chunk): break   # all fields found
+                item_data = extractor.result() '''
+
+    def __init__(self):
+        self._buffer = bytearray()  # unprocessed tail of the page
+        self._pos = 0               # where next marker search in buffer starts
+        self._eof = False
+        self._fields = dict()
+        self.bytes_fed = 0
+
+    @property
+    def done(self):
+        return len(self._fields) == len(MARKERS)
+
+    def _field(self, field, start, end):
+        ''' Value of field whose marker is at buffer[start:end], None if more data is needed. '''
+
+        buffer = self._buffer
+        if field == 'info':
+            info_end = buffer.find(b'</title>', end)
+            if info_end == -1:
+                return _decode(buffer[end:]) if self._eof else None
+            return _decode(buffer[end:info_end])
+
+        if field == 'name':  # window is in characters, utf-8 char takes up to 4 bytes
+            if len(buffer) < end + NAME_WINDOW * 4 and not self._eof:
+                return None
+            window = _decode(buffer[end:end + NAME_WINDOW * 4])[:NAME_WINDOW]
+            name_end = window.find('</h1>')
+            return window[:name_end].strip() if name_end != -1 else ''
+
+        if field == 'price':
+            if len(buffer) < end + PRICE_WINDOW and not self._eof:
+                return None
+            window = buffer[end:end + PRICE_WINDOW]
+            price_end = window.find(b'"')
+            return _decode(window[:price_end]) if price_end != -1 else ''
+
+        # image may be either jpg or png, so search from right to left
+        html_part = buffer[max(0, start - IMAGE_WINDOW):start]
+        image_link_start = html_part.rfind(b'upload')
+        image_link_end = html_part.rfind(b'"')
+        if image_link_start == -1 or image_link_end < image_link_start:
+            return ''
+        return SITE + _decode(html_part[image_link_start:image_link_end])
+
+    def _scan(self):
+        buffer = self._buffer
+        while not self.done:
+            match = MARKERS_RE.search(buffer, self._pos)
+            if match is None:  # part of marker may be at the end, search it again with next chunk
+                if not self._eof:
+                    self._pos = max(self._pos, len(buffer) - LONGEST_MARKER + 1)
+                break
+
+            field = MARKERS[match.group()]
+            if field not in self._fields:  # only first occurrence counts
+                value = self._field(field, match.start(), match.end())
+                if value is None:  # wait for next chunk, then search from this marker again
+                    self._pos = match.start()
+                    break
+                self._fields[field] = value
+            self._pos = match.end()
+
+        # drop processed part of buffer, keeping window needed to look back for image link
+        cut = self._pos - IMAGE_WINDOW
+        if cut > 0:
+            del buffer[:cut]
+            self._pos -= cut
+
+    def feed(self, chunk):
+        ''' Process next part of page. Returns True when all fields are found. '''
+
+        self.bytes_fed += len(chunk)
+        self._buffer += chunk
+        self._scan()
+        return self.done
+
+    def close(self):
+        ''' Page has ended, fields still waiting for data are taken as they are. '''
+
+        self._eof = True
+        self._scan()
+
+    def result(self):
+        ''' ItemData with fields found so far. '''
+
+        if not self.done and not self._eof:
+            self.close()
+        price = self._fields.get('price')
+        return ItemData(self._fields.get('name', ''),
+                        price if price is not None else NOT_IN_STOCK,
+                        self._fields.get('image_link', ''),
+                        self._fields.get('info', ''))
+
+
+def extract(html_file):
+    ''' ItemData from whole page, html_file is either bytes or str. '''
+
+    if isinstance(html_file, str):
+        html_file = html_file.encode('utf-8')
+    extractor = PageExtractor()
+    page = memoryview(html_file)
+    for start in range(0, len(page), CHUNK_SIZE):  # fields are at the beginning, rest of page is not even looked at
+        if extractor.feed(page[start:start + CHUNK_SIZE]):
+            break
+    return extractor.result()
+
+
+def extract_listing(html_file, page_url):
+    ''' ([ListingEntry] of all product cards, URL of next listing page or None) from listing page (bytes). '''
+
+    entries = []
+    starts = [match.start() for match in CARD_RE.finditer(html_file)]
+    for start, end in zip(starts, starts[1:] + [len(html_file)]):
+        card = html_file[start:end]
+        link = CARD_LINK_RE.search(card)
+        if link is None:
+            continue
+        name = CARD_NAME_RE.search(card)
+        price = CARD_PRICE_RE.search(card)
+        price = _decode(price.group(1)) if price is not None else ''
+        entries.append(ListingEntry(up.urljoin(page_url, _decode(link.group(1))),
+                                    _decode(name.group(1)).strip() if name is not None else '',
+                                    price if price.isdigit() else NOT_IN_STOCK))
+
+    next_page = NEXT_PAGE_RE.search(html_file)
+    return entries, up.urljoin(page_url, _decode(next_page.group(1))) if next_page is not None else None
@@ -0,0 +1,163 @@
+''' Price statistics of items: latest in-stock price, min, max, mean, moving averages and volatility.
+    Computed for all items in one pass over their int price arrays (product_base.PriceSeries) and cached;
+    when new prices are appended, only they are added to cached stats instead of recomputing everything.
+    PriceSeries keeps price changes as intervals, so mean is weighted by time every price was valid,
+    while moving averages and volatility are over price changes. '''
+
+import math
+from collections import deque
+
+
+MOVING_AVERAGE_WINDOWS = (10,)  # price changes in moving averages
+
+
+class PriceStats:
+    ''' Running statistics over in-stock prices of one item. '''
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'latest', 'recent',
+                 'weighted_total', 'weight', 'open_since', 'open_until',
+                 'changes', 'change_sum', 'change_squares', 'seen', 'last_minutes')
+
+    def __init__(self, window):
+        self.count = 0           # in-stock prices
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.latest = None       # latest in-stock price
+        self.recent = deque(maxlen=window)  # latest in-stock prices, for moving averages
+
+        # sum of prices multiplied by minutes they were valid, for mean; open interval is the latest one,
+        # it ends when price is last seen and gets longer with every update which finds the same price
+        self.weighted_total = 0
+        self.weight = 0
+        self.open_since = None   # minutes latest in-stock price is valid from, None if it is not the latest any more
+        self.open_until = None   # minutes it was last seen
+
+        # relative changes between consecutive in-stock prices, for volatility
+        self.changes = 0
+        self.change_sum = 0.0
+        self.change_squares = 0.0
+
+        # which part of PriceSeries is already counted
+        self.seen = 0
+        self.last_minutes = None
+
+    def add(self, value):
+        ''' Count next in-stock price. '''
+
+        if self.latest:
+            change = (value - self.latest) / self.latest
+            self.changes += 1
+            self.change_sum += change
+            self.change_squares += change * change
+
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        self.latest = value
+        self.recent.append(value)
+
+    def close(self, minutes):
+        ''' Latest price stopped being valid at minutes (price changed or item went out of stock). '''
+
+        if self.open_since is not None:
+            self.weighted_total += self.latest * (minutes - self.open_since)
+            self.weight += minutes - self.open_since
+            self.open_since = None
+
+    @property
+    def mean(self):
+        ''' Average weighted by time prices were valid; plain average if they all were seen only once. '''
+
+        weighted_total, weight = self.weighted_total, self.weight
+        if self.open_since is not None:
+            weighted_total += self.latest * (self.open_until - self.open_since)
+            weight += self.open_until - self.open_since
+        if weight:
+            return int(weighted_total / weight)
+        return int(self.total / self.count) if self.count else None
+
+    def moving_average(self, window=MOVING_AVERAGE_WINDOWS[0]):
+        ''' Average of last window prices (changes of price), or of all of them if there are fewer. '''
+
+        if not self.recent:
+            return None
+        values = list(self.recent)[-window:]
+        return sum(values) // len(values)
+
+    def to_list(self):
+        ''' Values of all fields, for snapshot.py. '''
+        return [list(self.recent) if slot == 'recent' else getattr(self, slot) for slot in self.__slots__]
+
+    @classmethod
+    def from_list(cls, window, values):
+        stats = cls(window)
+        for slot, value in zip(cls.__slots__, values):
+            setattr(stats, slot, deque(value, maxlen=window) if slot == 'recent' else value)
+        return stats
+
+    @property
+    def volatility(self):
+        ''' Standard deviation of relative price changes, 0.01 is 1%. '''
+
+        if self.changes < 2:
+            return 0.0
+        mean = self.change_sum / self.changes
+        return math.sqrt(max(0.0, self.change_squares / self.changes - mean * mean))
+
+
+class StatsCache:
+    ''' PriceStats of every item by its URL. '''
+
+    def __init__(self, windows=MOVING_AVERAGE_WINDOWS):
+        self.windows = windows
+        self._stats = dict()
+
+    def update(self, items):
+        ''' Bring stats of items up to date. Prices appended since last update are added to cached stats,
+            items whose history was changed otherwise (deleted or older prices inserted) are recomputed. '''
+
+        for item in items:
+            series = item.prices
+            stats = self._stats.get(item.url)
+            if (stats is None or stats.seen > len(series)
+                    or (stats.seen and series.minutes[stats.seen - 1] != stats.last_minutes)):
+                stats = self._stats[item.url] = PriceStats(max(self.windows))
+
+            for minutes, value in series.intervals(stats.seen):
+                stats.close(minutes)
+                if value is not None:
+                    stats.add(value)
+                    stats.open_since = minutes
+            stats.seen = len(series)
+            stats.last_minutes = series.minutes[-1] if series.minutes else None
+            if stats.open_since is not None:
+                stats.open_until = series.seen[-1]  # latest interval may have got longer without new prices
+
+    def dump(self):
+        ''' All stats as JSON-compatible data, see load(). '''
+        return {'window': max(self.windows), 'fields': PriceStats.__slots__,
+                'stats': {url: stats.to_list() for url, stats in self._stats.items()}}
+
+    def load(self, data):
+        ''' Replace stats with ones from dump(); False if they were computed differently (fields or window
+            have changed since), then stats must be computed with update(). '''
+
+        window = max(self.windows)
+        if data.get('window') != window or data.get('fields') != list(PriceStats.__slots__):
+            return False
+        self._stats = {url: PriceStats.from_list(window, values) for url, values in data['stats'].items()}
+        return True
+
+    def invalidate(self, url):
+        ''' Forget stats of item, they will be recomputed on next update. '''
+        self._stats.pop(url, None)
+
+    def get(self, url):
+        ''' PriceStats of item, None if item is unknown. '''
+        return self._stats.get(url)
+
+    def total(self):
+        ''' Sum of latest in-stock prices of all items. '''
+        return sum(stats.latest for stats in self._stats.values() if stats.latest is not None)
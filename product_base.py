@@ -1,90 +1,361 @@
 ''' Gets XML file, returns ProductBase object that contains list of Item objects, 
-    each holding info from one of <item> tags in XML. '''
+    each holding info from one of <item> tags in XML.
+    File may also be SQLite database, see storage.py. '''
 
-import xml.etree.ElementTree as et
+import bisect
+import calendar
+import functools
+import time
+from array import array
 from dataclasses import dataclass
 
-@dataclass
+import price_stats
+import snapshot
+import storage
+
+
+NOT_IN_STOCK = 'NOT IN STOCK'
+OUT_OF_STOCK = -1  # price value for NOT_IN_STOCK (and anything else that is not a number)
+DATE_FORMAT = '%Y.%m.%d %H:%M'  # as tcxml writes it: 2021.08.24 12:00
+
+
+@functools.lru_cache(maxsize=65536)  # all items are updated in the same runs, so they share dates
+def date_to_minutes(date):
+    ''' '2021.08.24 12:00' -> minutes since epoch. Slicing is much faster than strptime for millions of dates. '''
+    return calendar.timegm((int(date[0:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]), 0)) // 60
+
+
+@functools.lru_cache(maxsize=65536)
+def minutes_to_date(minutes):
+    return time.strftime(DATE_FORMAT, time.gmtime(minutes * 60))
+
+
+def price_to_int(price):
+    return int(price) if price and price.isdigit() else OUT_OF_STOCK
+
+
+def int_to_price(value):
+    return str(value) if value != OUT_OF_STOCK else NOT_IN_STOCK
+
+
+class PriceSeries:
+    ''' Price history of one item as intervals in three arrays of 4-byte ints: date price is valid from,
+        date it was last seen (minutes since epoch) and price (OUT_OF_STOCK if not in stock), sorted by date.
+        Only changes are kept: price equal to the latest one just extends its interval, so series grows
+        with price changes, not with number of updates. ~12 bytes per price instead of ~200 for dict of strings.
+        Behaves like dict {date string: price string} of dates prices changed; strings are made only when asked. '''
+
+    __slots__ = ('minutes', 'amounts', 'seen')
+
+    def __init__(self, prices=()):
+        self.minutes = array('i')
+        self.amounts = array('i')
+        self.seen = array('i')
+        self.update(prices)
+
+    @classmethod
+    def from_arrays(cls, minutes, amounts, seen):
+        ''' Series of arrays as they are (see snapshot.py), without converting every price. '''
+
+        series = cls()
+        series.minutes, series.amounts, series.seen = minutes, amounts, seen
+        return series
+
+    def __setitem__(self, date, price):
+        self.add(date, price, date)
+
+    def add(self, date, price, seen):
+        ''' Add price valid from date and last seen at seen date. '''
+
+        minutes, value = date_to_minutes(date), price_to_int(price)
+        seen = date_to_minutes(seen) if seen != date else minutes
+        if not self.minutes or minutes > self.minutes[-1]:  # usual case, new price is the latest
+            if self.amounts and value == self.amounts[-1]:  # unchanged, latest interval gets longer
+                self.seen[-1] = max(self.seen[-1], seen)
+                return
+            self.minutes.append(minutes)
+            self.amounts.append(value)
+            self.seen.append(seen)
+            return
+        index = bisect.bisect_left(self.minutes, minutes)
+        if index < len(self.minutes) and self.minutes[index] == minutes:  # same date, replace
+            self.amounts[index] = value
+            self.seen[index] = max(self.seen[index], seen)
+        else:
+            self.minutes.insert(index, minutes)
+            self.amounts.insert(index, value)
+            self.seen.insert(index, seen)
+
+    def _index(self, date):
+        minutes = date_to_minutes(date)
+        index = bisect.bisect_left(self.minutes, minutes)
+        if index < len(self.minutes) and self.minutes[index] == minutes:
+            return index
+        raise KeyError(date)
+
+    def __getitem__(self, date):
+        return int_to_price(self.amounts[self._index(date)])
+
+    def __contains__(self, date):
+        try:
+            self._index(date)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __iter__(self):
+        return map(minutes_to_date, self.minutes)
+
+    def __eq__(self, other):
+        if isinstance(other, PriceSeries):
+            return self.minutes == other.minutes and self.amounts == other.amounts and self.seen == other.seen
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return map(int_to_price, self.amounts)
+
+    def items(self):
+        return zip(self, self.values())
+
+    def update(self, prices):
+        ''' Add (date, price, last seen date) as storage gives them. '''
+        for date, price, seen in prices:
+            self.add(date, price, seen)
+
+    def pop(self, date):
+        index = self._index(date)
+        price = int_to_price(self.amounts[index])
+        self._delete(index)
+        if 0 < index < len(self.amounts) and self.amounts[index - 1] == self.amounts[index]:
+            self.seen[index - 1] = self.seen[index]  # prices around deleted one are the same, join them
+            self._delete(index)
+        return price
+
+    def _delete(self, index):
+        del self.minutes[index]
+        del self.amounts[index]
+        del self.seen[index]
+
+    def seen_date(self, date):
+        ''' Date price which is valid from date was last seen. '''
+        return minutes_to_date(self.seen[self._index(date)])
+
+    def item_at(self, index):
+        ''' (date, price, last seen date) by position, oldest first. '''
+        return (minutes_to_date(self.minutes[index]), int_to_price(self.amounts[index]),
+                minutes_to_date(self.seen[index]))
+
+    def keep_last(self, count):
+        ''' Drop all prices but count latest. '''
+        del self.minutes[:-count]
+        del self.amounts[:-count]
+        del self.seen[:-count]
+
+    def last_date(self):
+        ''' Date price was last seen, i.e. of latest update. '''
+        return minutes_to_date(self.seen[-1]) if self.seen else None
+
+    def intervals(self, start=0):
+        ''' (minutes price is valid from, price as int or None if not in stock) from index start on. '''
+        return [(minutes, value if value != OUT_OF_STOCK else None)
+                for minutes, value in zip(self.minutes[start:], self.amounts[start:])]
+
+
+@dataclass(slots=True)
 class Item:
     name: str
     info: str
     url: str
     img_url: str
-    prices: dict
+    prices: PriceSeries
+    complete: bool = True  # False if only latest prices are loaded (ProductBase with keep_last)
 
 
 class ProductBase:
-    def __init__(self, xml):
+    ''' Items are known by URL (stripped): names may be empty or the same for different items.
+        keep_last=N keeps in memory only N latest prices of every item ("summary only"),
+        all prices of item are loaded when needed by load_history().
+        With use_snapshot base is loaded from <xml>.snapshot if file hasn't changed since it was written
+        (see snapshot.py), and snapshot is written after loading from file. '''
+
+    def __init__(self, xml, keep_last=None, use_snapshot=True):
         self._xml = xml   # filename
-        self._items = []  # list of Item objects
-        self.parse_xml()  # new ProductBase should be provided with valid XML to get data from
-                          # multiple ProductBases can be created from multiple XMLs
+        self._items = dict()  # url -> Item, in order of file
+        self._stored_urls = dict()  # url -> url as it is in file (may have spaces around)
+        self.keep_last = keep_last
+        self._deleted_prices = []  # (stored url, date, last seen date) deleted from base, but not yet from file
+        self.stats = price_stats.StatsCache()  # url -> PriceStats, kept up to date with prices in base
+        self.storage = storage.open_storage(xml)  # XML or SQLite, by file extension
+        self.snapshot_file = xml + '.snapshot' if use_snapshot else None
+
+        state = snapshot.source_state(self.storage.files()) if use_snapshot else None
+        if not use_snapshot or not self._load_snapshot(state):
+            self.parse_xml()  # new ProductBase should be provided with valid XML to get data from
+                              # multiple ProductBases can be created from multiple XMLs
+            if use_snapshot:
+                self.save_snapshot(state)
 
     @property
-    def items(self): return self._items
+    def items(self): return list(self._items.values())
     
     @property
     def xml(self): return self._xml
 
 
+    def get_item(self, url):
+        ''' Item by URL, None if there's no such item. '''
+        return self._items.get(url)
+
+
     def parse_xml(self):
-        self.data = et.parse(self.xml)
-        self.xmlroot = self.data.getroot()
-        item_names = [item.name for item in self.items]
+        ''' Load items from file. For items already in base only prices newer than latest loaded one are added. '''
 
-        for entry in self.xmlroot.findall('item'):
-            name = entry.attrib['name'].strip()
-            
-            if name in item_names:  # item already added to base
-                latest_price = entry.findall('price')[-1]
-                for item in self.items:
-                    if item.name == name:  # add only new price
-                        item.prices[f'{latest_price.attrib["date"]}'] = latest_price.text
+        known = {item.url: item.prices.last_date() for item in self._items.values() if item.prices}  # url -> latest date
+        changed = []  # items with new prices, their stats are updated after load
+
+        # file is read item by item and only Items are kept, not the whole file
+        for record in self.storage.load_items(known, self.keep_last):
+            url = record.url.strip()
+            item = self._items.get(url)
+
+            if item is not None:  # item already added to base, add only new prices
+                item.prices.update(record.prices)
+                changed.append(item)
+                if self.keep_last is not None and len(item.prices) > self.keep_last:
+                    item.prices.keep_last(self.keep_last)  # drop oldest
+                    item.complete = False
 
             else:  # item not in base, get all data and create Item object
-                url = entry.find('url').text.strip()
+                name = record.name.strip()
 
                 # totally new item doesn't have any info, so check it
-                info_element = entry.find('info')
-                img_url_element = entry.find('image')
+                info = record.info.strip() if record.info != None else ''
+                img_url = record.image.strip() if record.image != None else ''
 
-                info = info_element.text.strip() if info_element != None else ''
-                img_url = img_url_element.text.strip() if img_url_element != None else ''
-
-                prices = dict()
-                for subentry in entry.findall('price'):
-                    prices[f'{subentry.attrib["date"]}'] = subentry.text
+                prices = PriceSeries(record.prices)  # strings are converted only here, on load
+                # with exactly keep_last prices loaded there may be older ones
+                complete = self.keep_last is None or len(record.prices) < self.keep_last
     
-                self._items.append(Item(name, info, url, img_url, prices))
+                self._items[url] = Item(name, info, url, img_url, prices, complete)
+                self._stored_urls[url] = record.url
+                changed.append(self._items[url])
+
+        self.stats.update(changed)  # only new prices are added to stats of known items
 
 
-    def delete_item(self, item_name):
-        for entry in self.items:
-            if item_name == entry.name:
-                self.items.remove(entry)
+    def _load_snapshot(self, state):
+        ''' Load items from snapshot, False if it's missing or stale. '''
 
+        data = snapshot.read(self.snapshot_file, state, self.keep_last)
+        if data is None:
+            return False
+        items, stats = data
+        for name, info, url, stored_url, img_url, complete, prices in items:
+            self._items[url] = Item(name, info, url, img_url, PriceSeries.from_arrays(*prices), complete)
+            self._stored_urls[url] = stored_url
+        if not self.stats.load(stats):  # written by other version of price_stats
+            self.stats.update(self._items.values())
+        return True
 
-    def delete_price(self, item_name, date_to_delete):
-        ''' Search price by date and delete it. '''
+
+    def save_snapshot(self, state=None):
+        ''' Write snapshot of base for next start. Base must be the same as file: called after it's loaded
+            from file and after update, when all its prices are in file. state is snapshot.source_state()
+            of file before it was read, now if not given. '''
+
+        if self.snapshot_file is None or self._deleted_prices:  # deleted prices are still in file
+            return
+        if state is None:
+            state = snapshot.source_state(self.storage.files())
+        try:
+            snapshot.write(self.snapshot_file, state, self.keep_last,
+                           [(item.name, item.info, item.url, self._stored_urls[item.url], item.img_url,
+                             item.complete, item.prices) for item in self._items.values()],
+                           self.stats.dump())
+        except OSError as error:  # read-only folder and such: base works without snapshot
+            print(f'Snapshot not written: {error}')
+
+
+    def add_price(self, url, item_data, date):
+        ''' Add price of one item just parsed by tcxml.parse() (see tcxml.Progress), so base follows
+            the file while it's being updated and doesn't have to be reloaded after update.
+            item_data None means page is unchanged, so previous price is repeated with new date. '''
+
+        item = self._items.get(url.strip())
+        if item_data is None:
+            if item is None or not item.prices:  # deleted from base
+                return
+            item.prices[date] = int_to_price(item.prices.amounts[-1])
+
+        else:
+            # by URL, as storage does: name on page may differ from name in file
+            if item is None:
+                item = self._items[url.strip()] = Item(item_data.name.strip(), item_data.info, url.strip(),
+                                                       item_data.image_link, PriceSeries())
+                self._stored_urls[item.url] = url
+            else:  # fill in what's missing, as storage does
+                item.info = item.info or item_data.info
+                item.img_url = item.img_url or item_data.image_link
+            item.prices[date] = item_data.price
+
+        if self.keep_last is not None and len(item.prices) > self.keep_last:
+            item.prices.keep_last(self.keep_last)
+            item.complete = False
+        self.stats.update([item])
+
+
+    def load_history(self, item):
+        ''' Make sure all prices of item are in memory (in summary mode only latest are loaded). '''
+
+        if item.complete:
+            return
+        stored_url = self._stored_urls[item.url]
+        record = self.storage.load_item(stored_url)
+        deleted = [(date, seen) for url, date, seen in self._deleted_prices if url == stored_url]
+        item.prices = PriceSeries(price for price in record.prices
+                                  if not any(date <= price[0] <= seen for date, seen in deleted))
+        item.complete = True
+        self.stats.invalidate(item.url)  # stats were of latest prices only
+        self.stats.update([item])
+
+
+    def delete_item(self, url):
+        self._items.pop(url, None)
+        self.stats.invalidate(url)
+
+
+    def delete_price(self, url, date_to_delete):
+        ''' Search price of item with URL by date and delete it, with all the time it was seen unchanged
+            after that date. '''
         
-        for entry in self.items:
-            if item_name == entry.name:
-                for date in entry.prices.keys():
-                    if date == date_to_delete:
-                        entry.prices.pop(date)
-                        return
+        item = self._items.get(url)
+        if item is not None and date_to_delete in item.prices:
+            seen = item.prices.seen_date(date_to_delete)
+            item.prices.pop(date_to_delete)
+            self._deleted_prices.append((self._stored_urls[url], date_to_delete, seen))
+            self.stats.invalidate(url)
+            self.stats.update([item])
                     
                 
     def apply_changes_to_xml(self):
-        ''' Compare ProductBase to XML and delete all price tags which are in XML but were deleted from base. 
+        ''' Delete from file all prices which were deleted from base.
             Called on base update, on program exit or manually by button. '''
-        for item in self.items:
-            xml_tag = self.xmlroot.find(f'item[@name="{item.name}"]')
-            for element in xml_tag.findall('price'):
-                if element.attrib['date'] not in list(item.prices):
-                    xml_tag.remove(element)
 
-        self.data.write(self.xml)
+        if not self._deleted_prices:
+            return
+        self.storage.delete_prices(self._deleted_prices)
+        self.storage.commit()
+        self._deleted_prices = []
+        self.save_snapshot()
 
             
 
@@ -94,7 +365,6 @@ if __name__ == '__main__':
     for item in pbase.items:
         print(item)
     print()
-    pbase.delete_price(pbase.items[0].name, '2021.09.16 19:32')
+    pbase.delete_price(pbase.items[0].url, '2021.09.16 19:32')
     for item in pbase.items:
         print(item)
-    
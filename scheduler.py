@@ -0,0 +1,161 @@
+''' Schedule of item updates for daemon mode of tcxml (python -m tcxml daemon).
+    Every URL has its own due time. Times of new URLs are spread over the whole interval
+    and every next time is jittered, so pages are requested evenly over time instead of all at once.
+    AdaptiveScheduler also gives every URL its own interval, following how often its price changes. '''
+
+import heapq
+import random
+import time
+
+from page_extractor import NOT_IN_STOCK
+
+
+INTERVAL = 6 * 3600  # seconds between updates of one item
+JITTER = 0.1         # every interval is randomly longer or shorter by up to 10%
+BATCH_WINDOW = 60    # items due within this many seconds are updated in one parse() run
+
+MIN_INTERVAL = 3600            # adaptive intervals are kept between these
+MAX_INTERVAL = 7 * 24 * 3600
+SPEEDUP = 0.5                  # interval is multiplied by this when price changes
+BACKOFF = 1.5                  # and by this when it doesn't
+DISCONTINUED_AFTER = 5         # item not in stock this many updates in a row is checked at MAX_INTERVAL
+
+
+class Scheduler:
+    ''' Usage:  schedule.sync(urls)              # URLs currently in file
+                due = schedule.pop_due()         # URLs to update now
+                ... update them ...
+                schedule.done(due)               # plan their next update
+                time.sleep(schedule.next_time() - time.time()) '''
+
+    def __init__(self, interval=INTERVAL, jitter=JITTER, batch_window=BATCH_WINDOW, clock=time.time):
+        self.interval = interval
+        self.jitter = jitter
+        self.batch_window = batch_window
+        self.clock = clock
+        self._due = dict()  # url -> time of next update
+        self._heap = []     # (time, url), earliest first; entries not matching _due are outdated and skipped
+
+    def _plan(self, url, at):
+        self._due[url] = at
+        heapq.heappush(self._heap, (at, url))
+
+    def _jittered(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def interval_for(self, url):
+        ''' Seconds until next update of URL which has just been updated. '''
+        return self.interval
+
+    def sync(self, urls):
+        ''' Follow list of URLs in file: new ones get a random time within interval, removed ones are dropped. '''
+
+        now = self.clock()
+        urls = set(urls)
+        for url in urls - self._due.keys():
+            self._plan(url, now + random.uniform(0, self.interval_for(url)))
+        for url in self._due.keys() - urls:
+            del self._due[url]
+
+    def next_time(self):
+        ''' Time of earliest planned update, None if there are no URLs. '''
+
+        while self._heap:
+            at, url = self._heap[0]
+            if self._due.get(url) == at:
+                return at
+            heapq.heappop(self._heap)  # outdated
+        return None
+
+    def pop_due(self):
+        ''' URLs which are due now or within batch window, removed from schedule until done() is called. '''
+
+        limit = self.clock() + self.batch_window
+        due = []
+        while True:
+            at = self.next_time()
+            if at is None or at > limit:
+                return due
+            _, url = heapq.heappop(self._heap)
+            del self._due[url]
+            due.append(url)
+
+    def done(self, urls):
+        ''' Plan next update of URLs which have just been updated. '''
+
+        now = self.clock()
+        for url in urls:
+            self._plan(url, now + self._jittered(self.interval_for(url)))
+
+
+class AdaptiveScheduler(Scheduler):
+    ''' Items whose price changes often are updated more often, stable and discontinued ones less often,
+        so the same number of requests covers more items. Starting interval of every URL is estimated
+        from its stored history by learn(), then adjusted after every update by observe():
+        shortened when price has changed, lengthened when it hasn't. '''
+
+    def __init__(self, interval=INTERVAL, jitter=JITTER, batch_window=BATCH_WINDOW, clock=time.time,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        super().__init__(interval, jitter, batch_window, clock)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._intervals = dict()      # url -> seconds
+        self._last_price = dict()     # url -> latest price seen (str)
+        self._out_of_stock = dict()   # url -> updates in a row it was not in stock
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def interval_for(self, url):
+        return self._intervals.get(url, self._clamp(self.interval))
+
+    def learn(self, url, prices):
+        ''' Estimate interval of URL from its stored prices [(date, price, last seen date)], oldest first:
+            half of average time between price changes, so a change is seen soon after it happens. '''
+
+        from product_base import date_to_minutes  # only daemon learns, update and export don't need it
+
+        if not prices:
+            return
+        values = [price for date, price, seen in prices]
+        changes = sum(1 for previous, price in zip(values, values[1:]) if price != previous)
+        span = (date_to_minutes(prices[-1][2]) - date_to_minutes(prices[0][0])) * 60
+        if span:
+            self._intervals[url] = self._clamp(span / (changes + 1) / 2)
+
+        # updates it is out of stock: stored one by one, or one price seen unchanged for some time
+        out_of_stock = 0
+        out_of_stock_since = None
+        for date, price, seen in reversed(prices):
+            if price != NOT_IN_STOCK:
+                break
+            out_of_stock += 1
+            out_of_stock_since = date
+        if out_of_stock_since is not None:
+            out_of_stock_span = (date_to_minutes(prices[-1][2]) - date_to_minutes(out_of_stock_since)) * 60
+            out_of_stock = max(out_of_stock, int(out_of_stock_span / self.interval_for(url)) + 1)
+
+        self._last_price[url] = values[-1]
+        self._out_of_stock[url] = out_of_stock
+        if out_of_stock >= DISCONTINUED_AFTER:
+            self._intervals[url] = self.max_interval
+
+    def observe(self, url, item_data, error=None):
+        ''' Result of update of URL (see tcxml.Progress): item_data None means page is unchanged. '''
+
+        interval = self.interval_for(url)
+        if error is not None or item_data is None:  # broken or unchanged page
+            self._intervals[url] = self._clamp(interval * BACKOFF)
+            return
+
+        price = item_data.price
+        previous = self._last_price.get(url)
+        self._last_price[url] = price
+        self._out_of_stock[url] = self._out_of_stock.get(url, 0) + 1 if price == NOT_IN_STOCK else 0
+
+        if self._out_of_stock[url] >= DISCONTINUED_AFTER:
+            self._intervals[url] = self.max_interval
+        elif previous is not None and price != previous:
+            self._intervals[url] = self._clamp(interval * SPEEDUP)
+        else:
+            self._intervals[url] = self._clamp(interval * BACKOFF)
@@ -0,0 +1,95 @@
+''' Binary snapshot of ProductBase, written next to its file (<filename>.snapshot), so next start doesn't have to
+    parse the whole XML again: loading it costs about the same whatever length price histories have.
+    Layout:  MAGIC, length of header (8 bytes, little-endian), header (JSON: item table, their price stats
+             and state of source files), then dates, prices and last seen dates of all items
+             as three arrays of 4-byte ints, item after item.
+    Snapshot is used only while source files (XML and its journal, or SQLite database) have the same size,
+    modification time and hash of their first and last HASHED_BYTES as when it was written; otherwise base is
+    loaded from file as before and snapshot is written again. '''
+
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+
+MAGIC = b'TCXSNAP1'
+VERSION = 2  # 2: items and stats by URL
+HASHED_BYTES = 65536  # from start and from end of file; hashing whole file would cost as much as parsing it
+LENGTH = struct.Struct('<Q')
+
+
+def source_state(filenames):
+    ''' [size, mtime, hash] of every file, None for missing ones. Taken before file is read,
+        so file changed while being read makes snapshot stale instead of wrong. '''
+
+    state = []
+    for filename in filenames:
+        try:
+            with open(filename, 'rb') as source:
+                info = os.fstat(source.fileno())
+                digest = hashlib.sha1(source.read(HASHED_BYTES))
+                if info.st_size > HASHED_BYTES:
+                    source.seek(max(HASHED_BYTES, info.st_size - HASHED_BYTES))
+                    digest.update(source.read(HASHED_BYTES))
+        except FileNotFoundError:
+            state.append(None)
+        else:
+            state.append([info.st_size, info.st_mtime_ns, digest.hexdigest()])
+    return state
+
+
+def write(filename, state, keep_last, items, stats):
+    ''' items is [(name, info, url, url as stored, img_url, complete, PriceSeries)],
+        stats is price_stats.StatsCache.dump(). Temporary file + rename, so reader never sees half-written snapshot. '''
+
+    minutes, amounts, seen = array('i'), array('i'), array('i')
+    table = []
+    for name, info, url, stored_url, img_url, complete, prices in items:
+        table.append([name, info, url, stored_url, img_url, complete, len(prices)])
+        minutes.extend(prices.minutes)
+        amounts.extend(prices.amounts)
+        seen.extend(prices.seen)
+
+    header = json.dumps({'version': VERSION, 'state': state, 'keep_last': keep_last,
+                         'byteorder': sys.byteorder, 'items': table, 'stats': stats}, ensure_ascii=False).encode('utf-8')
+    with open(filename + '.tmp', 'wb') as snapshot:
+        snapshot.write(MAGIC + LENGTH.pack(len(header)) + header)
+        for values in (minutes, amounts, seen):
+            values.tofile(snapshot)
+    os.replace(filename + '.tmp', filename)
+
+
+def read(filename, state, keep_last):
+    ''' (items as given to write(), with prices as (minutes, amounts, seen) arrays, stats),
+        None if there's no snapshot or it doesn't match state of source files or keep_last. '''
+
+    try:
+        with open(filename, 'rb') as snapshot:
+            if snapshot.read(len(MAGIC)) != MAGIC:
+                return None
+            header = json.loads(snapshot.read(LENGTH.unpack(snapshot.read(LENGTH.size))[0]))
+            if header['version'] != VERSION or header['state'] != state or header['keep_last'] != keep_last:
+                return None
+            count = sum(entry[-1] for entry in header['items'])
+            columns = []
+            for _ in range(3):
+                values = array('i')
+                values.fromfile(snapshot, count)
+                if header['byteorder'] != sys.byteorder:
+                    values.byteswap()
+                columns.append(values)
+    except (OSError, EOFError, ValueError, KeyError, struct.error):  # missing, truncated or broken: parse file
+        return None
+
+    minutes, amounts, seen = columns
+    items = []
+    start = 0
+    for name, info, url, stored_url, img_url, complete, length in header['items']:
+        end = start + length
+        items.append((name, info, url, stored_url, img_url, complete,
+                      (minutes[start:end], amounts[start:end], seen[start:end])))
+        start = end
+    return items, header['stats']
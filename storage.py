@@ -0,0 +1,629 @@
+''' Storage backends for price history, used by ProductBase and tcxml.parse():
+      XMLStorage     original XML file:  <root><item name="..."><url/><info/><image/><price date="...">...</price>...</item></root>
+      SQLiteStorage  SQLite database with items and prices tables; new prices are appended in one transaction,
+                     so cost of update depends on number of new prices, not on size of history
+    open_storage() picks backend by file extension. Both have the same methods, see XMLStorage.
+
+    Only price changes are stored (changes_only=True, default): price is valid from its date,
+    update which finds the same price only moves its last seen date (<price date="..." seen="...">).
+    Prices without seen date were seen once; files written before are read as they are.
+
+    Convert existing file (lossless, both ways):  python storage.py convert new_pc.xml new_pc.sqlite
+    Fold XML journal into XML file:                python storage.py compact new_pc.xml
+    Keep only price changes in old file (one-off): python storage.py compress new_pc.xml '''
+
+import json
+import os
+import sqlite3
+import sys
+import uuid
+import xml.etree.ElementTree as et
+from dataclasses import dataclass
+from typing import NamedTuple
+
+
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+JOURNAL_COMPACT_RATIO = 0.25  # journal bigger than this part of XML is folded into XML
+
+
+class ItemRecord(NamedTuple):
+    ''' One item as stored, texts are not stripped and may be None if element is missing. '''
+    name: str
+    url: str
+    info: str
+    image: str
+    prices: list  # [(date, price, last seen date), ...] in order of adding
+
+
+@dataclass
+class ItemSummary:
+    ''' What XMLStorage needs to know about item to add prices to it. '''
+    key: tuple  # see XMLStorage
+    name: str
+    url: str
+    has_info: bool
+    has_image: bool
+    latest_price: str
+
+
+def open_storage(filename, changes_only=True):
+    ''' Backend for file, by extension: SQLite for .sqlite/.sqlite3/.db, XML for anything else. '''
+
+    if os.path.splitext(filename)[1].lower() in SQLITE_EXTENSIONS:
+        return SQLiteStorage(filename, changes_only)
+    return XMLStorage(filename, changes_only=changes_only)
+
+
+class XMLStorage:
+    ''' XML file is read with iterparse, item by item, so whole tree is never kept in memory;
+        for tcxml.parse() only a small index (url, latest price etc. of every item) is kept.
+        Whole tree is built only to write XML file (compact(), restore()).
+
+        With journal=True (default) changes are not written into XML, but appended to <filename>.journal,
+        one JSON record per line, fsync'ed on commit(). So update costs O(new prices) instead of rewriting
+        whole file. Reading applies journal over XML. compact() folds journal into XML; it is done
+        automatically when journal grows over JOURNAL_COMPACT_RATIO of XML size.
+        Journal starts with ["journal", id]; compacted XML gets <root journal="id">, so journal
+        left behind by a crash during compaction is known to be folded and is ignored.
+        Records:  ["item", key, name, url, info, image]   create item or fill its missing elements
+                  ["price", key, date, price]              add price
+                  ["seen", key, date]                      latest price is seen unchanged at date
+                  ["delete", key, date, until]             delete prices with dates from date to until (same as
+                                                           date if missing)
+        key is ["url", url] of item: names may be empty or the same for different items, URL is what item is
+        found by. Item without URL in XML has ["name", name], it applies to first item with the name.
+        Journals written before keys have name in place of key and are read as ["name", name]. '''
+
+    def __init__(self, filename, journal=True, changes_only=True):
+        self.filename = filename
+        self.journal_filename = filename + '.journal'
+        self.use_journal = journal
+        self.changes_only = changes_only  # unchanged price only moves last seen date of latest one
+        self._pending = []        # records of changes not written yet
+        self._tree = None         # ElementTree which replaces file contents (after restore())
+        self._journal_id = None   # id of journal file on disk
+        self._journal_end = 0     # length of its complete lines, a partially written line after them is cut off
+        self._summaries = None    # ItemSummary of every item, built when needed, see _build_index()
+
+    def _root_attrib(self):
+        ''' Attributes of <root>, without reading the rest of file. '''
+
+        if not os.path.isfile(self.filename):
+            return {}
+        with open(self.filename, 'rb') as xml_file:
+            event, root = next(et.iterparse(xml_file, events=('start',)))
+            return dict(root.attrib)
+
+    def _journal_records(self):
+        ''' Records of journal which is not folded into XML yet, plus changes not written yet. '''
+
+        if self._tree is not None:  # file contents are replaced, journal doesn't apply to them
+            return list(self._pending)
+        if not os.path.isfile(self.journal_filename):
+            return list(self._pending)
+
+        records = []
+        self._journal_end = 0
+        with open(self.journal_filename, 'rb') as journal:
+            for line in journal:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('line without end')
+                    records.append(_upgrade(json.loads(line)))
+                except ValueError:  # last line written partially (crash during write), it was never committed
+                    break
+                self._journal_end += len(line)
+        if not records or records[0][0] != 'journal':
+            return list(self._pending)
+        self._journal_id = records[0][1]
+        if self._root_attrib().get('journal') == self._journal_id:  # already compacted
+            return list(self._pending)
+        return records[1:] + self._pending
+
+    def _iter_xml(self):
+        ''' ItemRecords of XML file as it is on disk (or of restored tree), one by one. '''
+
+        if self._tree is not None:
+            for entry in self._tree.getroot().findall('item'):
+                yield _element_record(entry)
+            return
+        if not os.path.isfile(self.filename):  # file is created by linkedit, so this is just in case something's wrong
+            return
+
+        root = None
+        for event, element in et.iterparse(self.filename, events=('start', 'end')):
+            if root is None:
+                root = element
+            elif event == 'end' and element.tag == 'item':
+                yield _element_record(element)
+                root.clear()  # item is processed, free memory
+
+    def load_items(self, known=None, keep_last=None):
+        ''' Return ItemRecords of XML with journal applied, one by one.
+            known is {url: latest date} of items already loaded (by stripped URL), for those only prices with later dates are returned.
+            keep_last=N returns only last N prices of every item. '''
+
+        for key, record in self._load(known, keep_last):
+            yield record
+
+    def _load(self, known, keep_last):
+        ''' (key, ItemRecord) of every item for load_items(). '''
+
+        known = known or {}
+        changes = dict()  # key -> [(position in journal, record)] for it
+        for position, record in enumerate(self._journal_records()):
+            changes.setdefault(tuple(record[1]), []).append((position, record))
+
+        applied = set()  # keys which journal records are applied already: only to first item with the key
+        for record in self._iter_xml():
+            key = _item_key(record)
+            records = []
+            for record_key in (('url', record.url), ('name', record.name)):
+                if record_key in changes and record_key not in applied:
+                    records += changes[record_key]
+                    applied.add(record_key)
+            if records:
+                record = _replay(record, [change for position, change in sorted(records)])
+            yield key, _filter_prices(record, known.get(_stripped(record.url)), keep_last)
+
+        for key, records in changes.items():  # items created by journal
+            if key not in applied and records[0][1][0] == 'item':
+                record = _replay(ItemRecord(records[0][1][2], None, None, None, []),
+                                 [change for position, change in records])
+                yield key, _filter_prices(record, known.get(_stripped(record.url)), keep_last)
+
+    def files(self):
+        ''' Files contents are read from, to tell if they have changed (see snapshot.py). '''
+        return [self.filename, self.journal_filename]
+
+    def load_item(self, url):
+        ''' ItemRecord with all prices of item with URL (as in file), None if there's no such item. '''
+
+        for record in self.load_items():
+            if record.url == url:
+                return record
+        return None
+
+    def _build_index(self):
+        ''' Index of items for tcxml.parse(): ItemSummary of every item, in order of file,
+            by name (first item with the name, as root.find() would give) and by url. '''
+
+        self._summaries = []
+        self._by_key = dict()
+        self._by_name = dict()
+        self._by_url = dict()
+        for key, record in self._load(None, keep_last=1):
+            self._add_summary(ItemSummary(key, record.name, record.url, record.info is not None,
+                                          record.image is not None, record.prices[-1][1] if record.prices else None))
+
+    def _add_summary(self, summary):
+        self._summaries.append(summary)
+        self._by_key.setdefault(summary.key, summary)
+        self._by_name.setdefault(summary.name, summary)
+        if summary.url is not None:
+            self._by_url.setdefault(summary.url, summary)
+
+    def _change(self, *record):
+        self._pending.append(list(record))
+        if self._summaries is None:
+            return
+
+        # keep index up to date
+        kind, key = record[0], tuple(record[1])
+        summary = self._by_key.get(key)
+        if kind == 'item':
+            name, url, info, image = record[2:]
+            if summary is None:
+                self._add_summary(ItemSummary(key, name, url, info is not None, image is not None, None))
+            else:
+                summary.url = summary.url if summary.url is not None else url
+                summary.has_info = summary.has_info or info is not None
+                summary.has_image = summary.has_image or image is not None
+        elif kind == 'price' and summary is not None:
+            summary.latest_price = record[3]
+        elif kind == 'delete':  # latest price may be deleted, find it again when needed
+            self._summaries = None
+
+    def tracked_urls(self):
+        ''' [(url, latest price or None)] of all items, url as is in file. '''
+
+        if self._summaries is None:
+            self._build_index()
+        return [(summary.url, summary.latest_price) for summary in self._summaries if summary.url is not None]
+
+    def add_price(self, url, item_data, date):
+        ''' Add price of one parsed item (tcxml.ItemData).
+            item_data None means page is unchanged, so previous price is repeated with new date. '''
+
+        if self._summaries is None:
+            self._build_index()
+
+        if item_data is None:
+            summary = self._by_url[url]  # exists, tcxml.parse() checks it
+            if self.changes_only:
+                self._change('seen', list(summary.key), date)
+            else:
+                self._change('price', list(summary.key), date, summary.latest_price)
+            return
+
+        item_name, price, image_link, info = item_data
+
+        # item is found by URL it was parsed from: name on page may change, URL stays the same;
+        # by name only if item with the name has no URL (item from old file without <url>)
+        summary = self._by_url.get(url)
+        if summary is None:
+            summary = self._by_name.get(item_name)
+            if summary is not None and summary.url is not None:  # other item with the same name
+                summary = None
+        key = list(summary.key) if summary is not None else ['url', url]
+        # no such item (should exist because linkedit.py already created it) or it misses some data
+        if (summary is None or summary.url is None or not summary.has_info
+                or (not summary.has_image and image_link)):
+            self._change('item', key, summary.name if summary is not None else item_name, url, info,
+                         image_link or None)
+        if self.changes_only and summary is not None and summary.latest_price == str(price):
+            self._change('seen', key, date)
+        else:
+            self._change('price', key, date, str(price))
+
+    def delete_prices(self, deleted):
+        ''' deleted is list of (item URL as in file, date, last seen date): prices with dates from date
+            to last seen are deleted, so a price is deleted together with all updates which have seen it unchanged. '''
+
+        if self._summaries is None:
+            self._build_index()
+        keys = [list(self._by_url[url].key) for url, date, seen in deleted]
+        for key, (url, date, seen) in zip(keys, deleted):
+            self._change('delete', key, date, seen)
+
+    def dump(self):
+        ''' All ItemRecords exactly as stored, for conversion. '''
+        return list(self.load_items())
+
+    def restore(self, records):
+        ''' Replace contents with ItemRecords (from dump() of any storage). '''
+
+        root = et.Element('root')
+        for record in records:
+            _record_element(root, record)
+        self._tree = et.ElementTree(root)
+        self._pending = []
+        self._summaries = None
+
+    def commit(self):
+        ''' Write changes to journal (or whole file if journal is off), compact journal if it's too big. '''
+
+        if not self.use_journal or self._tree is not None:
+            self.compact()
+            return
+
+        if self._pending:
+            self._journal_records()  # find id of journal on disk
+            if self._journal_id is None or self._root_attrib().get('journal') == self._journal_id:  # start new journal
+                self._journal_id = uuid.uuid4().hex
+                lines = [json.dumps(['journal', self._journal_id])]
+                mode = 'w'
+            else:
+                lines = []
+                mode = 'a'
+                if os.path.getsize(self.journal_filename) > self._journal_end:  # records after torn line would be lost
+                    os.truncate(self.journal_filename, self._journal_end)
+            lines += [json.dumps(record, ensure_ascii=False) for record in self._pending]
+
+            with open(self.journal_filename, mode, encoding='utf-8') as journal:
+                journal.write('\n'.join(lines) + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+            self._pending = []
+
+        if (os.path.isfile(self.journal_filename) and os.path.isfile(self.filename) and
+                os.path.getsize(self.journal_filename) > JOURNAL_COMPACT_RATIO * os.path.getsize(self.filename)):
+            self.compact()
+
+    def compact(self):
+        ''' Write whole contents (XML + journal + changes not written yet) into XML file and remove journal. '''
+
+        root = et.Element('root')
+        for record in self.load_items():
+            _record_element(root, record)
+        if self._journal_id is not None:
+            root.set('journal', self._journal_id)  # mark journal as folded, in case it's not removed
+
+        temp_filename = self.filename + '.tmp'  # never leave XML half-written
+        with open(temp_filename, 'wb') as xml_file:
+            et.ElementTree(root).write(xml_file, encoding='utf-8', xml_declaration=True)
+            xml_file.flush()
+            os.fsync(xml_file.fileno())
+        os.replace(temp_filename, self.filename)
+
+        if os.path.isfile(self.journal_filename):
+            os.remove(self.journal_filename)
+        self._journal_id = None
+        self._pending = []
+        self._tree = None
+
+    def close(self):
+        pass
+
+
+def _element_record(entry):
+    return ItemRecord(entry.attrib['name'], entry.findtext('url'), entry.findtext('info'), entry.findtext('image'),
+                      [(price.attrib['date'], price.text, price.get('seen', price.attrib['date']))
+                       for price in entry.findall('price')])
+
+
+def _record_element(root, record):
+    ''' Add <item> for ItemRecord to root. '''
+
+    item = et.SubElement(root, 'item', name=record.name)
+    for tag, text in (('url', record.url), ('info', record.info), ('image', record.image)):
+        if text is not None:
+            et.SubElement(item, tag).text = text
+    for date, price, seen in record.prices:
+        element = et.SubElement(item, 'price', date=date)
+        if seen != date:
+            element.set('seen', seen)
+        element.text = price
+
+
+def _stripped(url):
+    return url.strip() if url is not None else None
+
+
+def _item_key(record):
+    ''' Key of item in journal (see XMLStorage), by its ItemRecord in XML file. '''
+    return ('url', record.url) if record.url is not None else ('name', record.name)
+
+
+def _upgrade(record):
+    ''' Journal record written before keys: name of item in place of key. '''
+
+    if isinstance(record[1], list) or record[0] == 'journal':
+        return record
+    if record[0] == 'item':  # ["item", name, url, info, image]
+        return ['item', ['name', record[1]]] + record[1:]
+    return [record[0], ['name', record[1]]] + record[2:]
+
+
+def _replay(record, records):
+    ''' ItemRecord with changes described by journal records made. '''
+
+    url, info, image, prices = record.url, record.info, record.image, list(record.prices)
+    for change in records:
+        kind = change[0]
+        if kind == 'item':  # fill missing elements
+            url = url if url is not None else change[3]
+            info = info if info is not None else change[4]
+            image = image if image is not None else change[5]
+        elif kind == 'price':
+            prices.append((change[2], change[3], change[2]))
+        elif kind == 'seen':
+            if prices:
+                prices[-1] = (prices[-1][0], prices[-1][1], change[2])
+        elif kind == 'delete':
+            until = change[3] if len(change) > 3 else change[2]
+            prices = [price for price in prices if not change[2] <= price[0] <= until]
+    return ItemRecord(record.name, url, info, image, prices)
+
+
+def _filter_prices(record, latest, keep_last):
+    ''' Leave only prices seen later than latest date and only keep_last of them. '''
+
+    prices = record.prices
+    if latest is not None:
+        prices = [price for price in prices if price[2] > latest]
+    if keep_last is not None:
+        prices = prices[-keep_last:]
+    if prices is record.prices:
+        return record
+    return record._replace(prices=prices)
+
+
+class SQLiteStorage:
+    ''' Items are kept in order of adding (by id), prices in order of adding (by rowid).
+        Items are found by URL, as in XMLStorage: names may be empty or the same for different items.
+        Same methods as XMLStorage; changes are made in a transaction which commit() finishes. '''
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            url TEXT,
+            info TEXT,
+            image TEXT);
+        CREATE TABLE IF NOT EXISTS prices (
+            item_id INTEGER NOT NULL REFERENCES items(id),
+            date TEXT NOT NULL,
+            price TEXT,
+            seen TEXT);
+        CREATE INDEX IF NOT EXISTS prices_item_date ON prices(item_id, date);
+        CREATE INDEX IF NOT EXISTS items_url ON items(url);'''
+
+    def __init__(self, filename, changes_only=True):
+        self.filename = filename
+        self.changes_only = changes_only
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(self.SCHEMA)
+        if 'seen' not in [column[1] for column in self.db.execute('PRAGMA table_info(prices)')]:
+            self.db.execute('ALTER TABLE prices ADD COLUMN seen TEXT')  # database made before, seen is NULL = date
+            self.db.commit()
+        if 'UNIQUE' in self.db.execute("SELECT sql FROM sqlite_master WHERE name = 'items'").fetchone()[0]:
+            self._drop_unique_name()  # database made before, items with the same name couldn't be added
+
+    def _drop_unique_name(self):
+        ''' Make items table again without UNIQUE on name; ids are kept, so prices still refer to their items.
+            New table is renamed to items, not old one away from it: renaming items would make
+            prices refer to the renamed table. '''
+
+        self.db.executescript('''
+            PRAGMA foreign_keys = OFF;
+            BEGIN;
+            CREATE TABLE new_items (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                url TEXT,
+                info TEXT,
+                image TEXT);
+            INSERT INTO new_items SELECT id, name, url, info, image FROM items;
+            DROP TABLE items;
+            ALTER TABLE new_items RENAME TO items;
+            CREATE INDEX IF NOT EXISTS items_url ON items(url);
+            COMMIT;''')
+
+    def load_items(self, known=None, keep_last=None):
+        ''' Same as XMLStorage.load_items(), but only prices which are needed are read from database. '''
+
+        known = known or {}
+        items = self.db.execute('SELECT id, name, url, info, image FROM items ORDER BY id').fetchall()
+        for item_id, name, url, info, image in items:
+            yield ItemRecord(name, url, info, image, self._prices(item_id, known.get(_stripped(url)), keep_last))
+
+    def _prices(self, item_id, latest=None, keep_last=None):
+        query = 'SELECT date, price, COALESCE(seen, date) FROM prices WHERE item_id = ?'
+        parameters = [item_id]
+        if latest is not None:
+            query += ' AND COALESCE(seen, date) > ?'
+            parameters.append(latest)
+        if keep_last is None:
+            return self.db.execute(query + ' ORDER BY rowid', parameters).fetchall()
+        prices = self.db.execute(query + ' ORDER BY rowid DESC LIMIT ?', parameters + [keep_last]).fetchall()
+        return prices[::-1]
+
+    def files(self):
+        return [self.filename]
+
+    def load_item(self, url):
+        row = self.db.execute('SELECT id, name, url, info, image FROM items WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        item_id, name, url, info, image = row
+        return ItemRecord(name, url, info, image, self._prices(item_id))
+
+    def _latest_price(self, item_id):
+        row = self.db.execute('SELECT price FROM prices WHERE item_id = ? ORDER BY rowid DESC LIMIT 1',
+                              (item_id,)).fetchone()
+        return row[0] if row else None
+
+    def _add_price(self, item_id, date, price):
+        ''' Append price, or only move last seen date of latest price if it is the same. '''
+
+        if self.changes_only:
+            row = self.db.execute('SELECT rowid, price FROM prices WHERE item_id = ? ORDER BY rowid DESC LIMIT 1',
+                                  (item_id,)).fetchone()
+            if row is not None and row[1] == price:
+                self.db.execute('UPDATE prices SET seen = ? WHERE rowid = ?', (date, row[0]))
+                return
+        self.db.execute('INSERT INTO prices VALUES (?, ?, ?, NULL)', (item_id, date, price))
+
+    def tracked_urls(self):
+        return [(url, self._latest_price(item_id))
+                for item_id, url in self.db.execute('SELECT id, url FROM items WHERE url IS NOT NULL ORDER BY id')]
+
+    def add_price(self, url, item_data, date):
+        if item_data is None:  # unchanged page, repeat previous price
+            item_id, = self.db.execute('SELECT id FROM items WHERE url = ?', (url,)).fetchone()
+            self._add_price(item_id, date, self._latest_price(item_id))
+            return
+
+        item_name, price, image_link, info = item_data
+        # by URL, as in XMLStorage: name on page may change; by name only if item with the name has no URL
+        row = self.db.execute('SELECT id FROM items WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            row = self.db.execute('SELECT id, url FROM items WHERE name = ? ORDER BY id LIMIT 1',
+                                  (item_name,)).fetchone()
+            if row is not None and row[1] is not None:  # other item with the same name
+                row = None
+        if row is None:
+            item_id = self.db.execute('INSERT INTO items (name, url, info, image) VALUES (?, ?, ?, ?)',
+                                      (item_name, url, info, image_link or None)).lastrowid
+        else:  # fill in what's missing
+            item_id = row[0]
+            self.db.execute('UPDATE items SET url = COALESCE(url, ?), info = COALESCE(info, ?), '
+                            'image = COALESCE(image, ?) WHERE id = ?', (url, info, image_link or None, item_id))
+        self._add_price(item_id, date, str(price))
+
+    def delete_prices(self, deleted):
+        self.db.executemany('DELETE FROM prices WHERE date BETWEEN ? AND ? '
+                            'AND item_id = (SELECT id FROM items WHERE url = ?)',
+                            [(date, seen, url) for url, date, seen in deleted])
+
+    def dump(self):
+        return list(self.load_items())
+
+    def restore(self, records):
+        self.db.execute('DELETE FROM prices')
+        self.db.execute('DELETE FROM items')
+        for record in records:  # every record is an item of its own, even if its name is the same as other's
+            item_id = self.db.execute('INSERT INTO items (name, url, info, image) VALUES (?, ?, ?, ?)',
+                                      (record.name, record.url, record.info, record.image)).lastrowid
+            self.db.executemany('INSERT INTO prices VALUES (?, ?, ?, ?)',
+                                [(item_id, date, price, seen if seen != date else None)
+                                 for date, price, seen in record.prices])
+
+    def commit(self):
+        self.db.commit()
+
+    def compact(self):
+        ''' Nothing to fold, prices are already appended in place. '''
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def convert(source, destination):
+    ''' Copy all data from one storage file to another, e.g. from XML to SQLite. '''
+
+    source_storage = open_storage(source)
+    destination_storage = open_storage(destination)
+    destination_storage.restore(source_storage.dump())
+    destination_storage.commit()
+    source_storage.close()
+    destination_storage.close()
+
+
+def compact(filename):
+    ''' Fold journal into XML file now. '''
+
+    file_storage = open_storage(filename)
+    file_storage.compact()
+    file_storage.close()
+
+
+def price_changes(prices):
+    ''' Prices [(date, price, last seen date)] with runs of the same price joined into one. '''
+
+    changes = []
+    for date, price, seen in prices:
+        if changes and changes[-1][1] == price:
+            changes[-1] = (changes[-1][0], price, max(changes[-1][2], seen))
+        else:
+            changes.append((date, price, seen))
+    return changes
+
+
+def compress(filename):
+    ''' Migrate file written with every update's price to price changes only (one-off, both backends).
+        Returns (prices before, prices after). '''
+
+    file_storage = open_storage(filename)
+    records = file_storage.dump()
+    compressed = [record._replace(prices=price_changes(record.prices)) for record in records]
+    file_storage.restore(compressed)
+    file_storage.commit()
+    file_storage.close()
+    return sum(len(record.prices) for record in records), sum(len(record.prices) for record in compressed)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'convert':
+        convert(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 3 and sys.argv[1] == 'compact':
+        compact(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == 'compress':
+        before, after = compress(sys.argv[2])
+        print(f'{before} prices -> {after} price changes')
+    else:
+        sys.exit('Usage: python storage.py convert <source.xml|.sqlite> <destination.xml|.sqlite>\n'
+                 '       python storage.py compact <file.xml>\n'
+                 '       python storage.py compress <file.xml|.sqlite>')
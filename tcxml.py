@@ -1,112 +1,448 @@
+import argparse
 import codecs
+import concurrent.futures as cf
+import csv
 import datetime as dt
-import os
-import ssl
+import json
+import signal
+import sys
+import threading
 import time
-import urllib.request as ur
-import xml.etree.ElementTree as et
+import urllib.parse as up
+from typing import NamedTuple, Optional
+
+import http_cache
+import http_retry
+import http_session
+import metrics
+import page_extractor
+import scheduler
+import storage
+
+
+MAX_WORKERS = 8   # how many pages are downloaded at the same time
+RATE_LIMIT = 4.0  # max requests started per second for one host, 0 for no limit
+COMMIT_EVERY = 50 # pages between commits, so crash in the middle of run doesn't lose all of it
+MAX_LISTING_PAGES = 100  # pages of one listing followed by "next" links, guards against link loops
+
+
+class Progress(NamedTuple):
+    ''' Passed to progress callback of parse() after every page. '''
+
+    done: int        # pages processed so far, failed ones included
+    total: int
+    errors: int      # pages which could not be downloaded
+    elapsed: float   # seconds since start
+    url: str         # page just processed, as is in file
+    item_data: Optional[page_extractor.ItemData]  # None if page is unchanged or failed
+    date: str        # date of its price
+    error: Optional[Exception] = None
+
+    @property
+    def eta(self):
+        ''' Estimated seconds left. '''
+        return self.elapsed / self.done * (self.total - self.done) if self.done else None
+
+
+class RateLimiter:
+    ''' Spaces out requests to the same host so parallel workers don't hammer the site.
+        Thread-safe, shared by all workers of one parse() run. '''
+
+    def __init__(self, per_second=RATE_LIMIT):
+        self.interval = 1 / per_second if per_second else 0
+        self._next_start = dict()  # host -> earliest time next request to it may start
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        ''' Block until a request to URL's host is allowed. '''
+
+        if not self.interval:
+            return
+
+        host = up.urlsplit(url).netloc
+        with self._lock:  # reserve time slot, then sleep outside the lock
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.interval
+
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def fetch_page(url):
+    ''' Loads webpage at provided URL address, returns it as bytes. '''
+    return http_session.get(url).body  # shared keep-alive connections, see http_session.py
 
 
 def open_url(url):
-    ''' Loads webpage at provided URL address. '''
-
-    # ignore ssl
-    ctx = ssl.create_default_context()
-    ctx.check_hostname = False
-    ctx.verify_mode = ssl.CERT_NONE    
-    
-    req = ur.Request(url, headers={'User-Agent': 'Magic Browser'})
-    result = ur.urlopen(req, context=ctx).read()
+    ''' Loads webpage at provided URL address. Same as fetch_page(), but decoded to str. '''
+
+    with metrics.timer('open_url'):
+        result = fetch_page(url)
     html_file = codecs.decode(result, encoding='utf-8', errors='ignore')
     return html_file
-    
+
 
 def get_item_name(html_file):
     ''' Searches and returns item's name from HTML code. 
         Used also by LinkEditor so moved to separate function. '''
 
-    name_string = 'class="product-title" itemprop="name">'
-    name_start = html_file.find(name_string) + len(name_string)
-    name_end = name_start + html_file[name_start:name_start + 100].find('</h1>')
-    name = html_file[name_start:name_end].strip()
-    return name
+    return page_extractor.extract(html_file).name
 
 
 def get_item_data(html_file):
-    ''' Searches through HTML code for name and price of the item. '''
-
-    # Get requested info from provided HTML code, returns tuple with data
-    name = get_item_name(html_file)
-
-    info_string = '<title>'
-    info_end_string = '</title>'
-    info_start = html_file.find(info_string) + len(info_string)
-    info_end = html_file.find(info_end_string)
-    info = html_file[info_start:info_end]
-
-    price_string = 'itemprop="price" content="'
-    price_start = html_file.find(price_string) + len(price_string)
-    price_end = price_start + html_file[price_start:price_start + 7].find('"')
-    price = html_file[price_start:price_end] if price_start != 25 else 'NOT IN STOCK'
-
-    # image may be either jpg or png, so search from right to left
-    image_link_pos = html_file.find('class="fbox-product-image')
-    html_part = html_file[image_link_pos - 200:image_link_pos]  # part of html containing image link
-    image_link_start = html_part.rfind('upload')
-    image_link_end = html_part.rfind('"')
-    image_link = 'https://topcomputer.ru/' + html_part[image_link_start:image_link_end]
-
-    return name, price, image_link, info
-
-
-def parse_url(root, url, counter, urls_len):
-    ''' Get one URL and write required data from it into XML. '''
-
-    item_name, price, image_link, info = get_item_data(open_url(url))
-    date = dt.datetime.now().strftime('%Y.%m.%d %H:%M')  # date format as 2021.08.24 12:00
-    print(f'Parsed URL #{counter+1} of {urls_len}: {item_name}')
-
-    item_tag = root.find(f'item[@name="{item_name}"]')  # if found, returns Element
-    if item_tag == None:  # no such item, create it
-                          # (item should exist because linkedit.py already created it)
-        new_cpu = et.SubElement(root, 'item', name=item_name)
-        et.SubElement(new_cpu, 'url').text = url
-        et.SubElement(new_cpu, 'info').text = info
-        et.SubElement(new_cpu, 'image').text = image_link
-        et.SubElement(new_cpu, 'price', date=date).text = str(price)
-    else:  # item already exists
-        if item_tag.find('url') == None:  # no url (should exist because linkedit.py)
-            et.SubElement(item_tag, 'url').text = url
-        if item_tag.find('info') == None:  # no info
-            et.SubElement(item_tag, 'info').text = info
-        if item_tag.find('image') == None:  # no image
-            et.SubElement(item_tag, 'image').text = image_link
-        et.SubElement(item_tag, 'price', date=date).text = str(price)
-
-
-def parse(xml_filename: str):
-    ''' Get urls from xml file (<item><url> ... </url></item>) and run parser for each of them. '''
-
-    if not os.path.isfile(xml_filename):      # if output file does not exist (should exist!), create it
-        out_file = open(xml_filename, 'w')    # and make it a valid empty XML
-        out_file.write('<root></root>')       # file is created by linkedit, so this is just in case something's wrong
-        out_file.close()
-
-    data = et.parse(xml_filename)             # open XML file as ElementTree
-    root = data.getroot()                     # get root tag as Element
-    
+    ''' Searches through HTML code (str or bytes) for name and price of the item.
+        Returns page_extractor.ItemData, which is a tuple (name, price, image_link, info). '''
+
+    with metrics.timer('get_item_data'):
+        return page_extractor.extract(html_file)
+
+
+def parse_url(url, limiter=None, cache=None, retry=None, breaker=None):
+    ''' Download one URL and get item data from it. Runs in worker threads, so must not touch XML.
+        Page is streamed to extractor, which stops as soon as all fields are found.
+        If cache (http_cache.ValidatorCache) is given, sends conditional request
+        and returns None if page has not changed since previous run.
+        Failed download is repeated as retry (http_retry.Retry) says, breaker (http_retry.CircuitBreaker)
+        stops requests to host which keeps failing; raises one of http_retry.FETCH_ERRORS if page can't be had. '''
+
+    def attempt(url):
+        if limiter is not None:
+            with metrics.timer('rate_limit_wait'):
+                limiter.wait(url)
+
+        headers = cache.headers(url) if cache is not None else None
+        extractor = page_extractor.PageExtractor()
+        feed = metrics.Accumulator(extractor.feed) if metrics.enabled else extractor.feed
+        response = http_session.get(url, headers, consumer=feed)
+        if metrics.enabled:
+            metrics.observe('extract', feed.seconds)
+        # body is only the part extractor has read, but it's the same part for the same page
+        if cache is not None and not cache.update(url, response):
+            return None
+        return extractor.result()
+
+    with metrics.timer('parse_url'):  # with retries and waiting for rate limit
+        return http_retry.call(attempt, url, retry, breaker)
+
+
+def _url_key(url):
+    ''' URL without scheme, www., query and trailing slash, so links on listing pages match URLs in file. '''
+
+    parts = up.urlsplit(url.strip())
+    host = (parts.hostname or '').removeprefix('www.')
+    return host + parts.path.rstrip('/')
+
+
+def harvest_listings(listing_urls, limiter=None, retry=None, breaker=None, max_pages=MAX_LISTING_PAGES):
+    ''' Download category or search listing pages, following their "next page" links, and return
+        {_url_key(product URL): page_extractor.ListingEntry} of all products on them.
+        One listing page gives prices of dozens of items. Listing which fails is skipped after retries,
+        its items are then parsed from their own pages. '''
+
+    def download(url):
+        if limiter is not None:
+            with metrics.timer('rate_limit_wait'):
+                limiter.wait(url)
+        return http_session.get(url).body
+
+    found = dict()
+    for url in listing_urls:
+        pages = 0
+        while url is not None and pages < max_pages:
+            try:
+                with metrics.timer('listing'):
+                    body = http_retry.call(download, url, retry, breaker)
+            except http_retry.FETCH_ERRORS as error:
+                print(f'Listing {url} failed: {error}')
+                break
+            entries, url = page_extractor.extract_listing(body, url)
+            for entry in entries:
+                found.setdefault(_url_key(entry.url), entry)
+            pages += 1
+            metrics.count('listing_pages')
+    return found
+
+
+def _log_errors(filename, failed):
+    ''' Append pages which failed in this run to errors log, one JSON list [date, url, error] per line. '''
+
+    if failed:
+        with open(filename, 'a', encoding='utf-8') as log:
+            log.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in failed)
+
+
+def parse(xml_filename: str, max_workers=MAX_WORKERS, rate_limit=RATE_LIMIT, use_cache=True,
+          progress=None, cancel=None, urls=None, retries=http_retry.RETRIES, metrics_file=None, listings=()):
+    ''' Get urls from xml file (<item><url> ... </url></item>) and run parser for each of them.
+        File may also be SQLite database, see storage.py.
+        Pages are downloaded by up to max_workers threads at once, no more than rate_limit
+        requests per second to one host; all changes to file are made here, in the calling thread.
+        With use_cache pages unchanged since previous run are not downloaded/parsed again
+        (validators are stored in <xml_filename>.cache).
+        Failed downloads are repeated up to retries times; pages which still fail are skipped, the rest are
+        parsed, and failures are logged to <xml_filename>.errors. Prices are committed every COMMIT_EVERY pages
+        and whenever parsing stops, even on error.
+        progress(Progress) is called in the calling thread after every page, also for pages which failed.
+        Setting cancel (threading.Event) stops parsing. Returns last Progress, None if there were no URLs.
+        urls limits parsing to these URLs of file (as they are in file), all are parsed if None.
+        With metrics_file timings of this run are written there (see metrics.py).
+        listings are URLs of category or search pages which list tracked items: prices of items found there
+        are taken from them (see harvest_listings) and only the rest are downloaded one by one.
+        Items without price in file are always parsed from their own pages, as listings have no info and image. '''
+
+    if metrics_file is None:
+        return _parse(xml_filename, max_workers, rate_limit, use_cache, progress, cancel, urls, retries, listings)
+
+    was_enabled = metrics.enabled
+    metrics.enable()
+    metrics.reset()
+    try:
+        state = _parse(xml_filename, max_workers, rate_limit, use_cache, progress, cancel, urls, retries, listings)
+        metrics.write(metrics_file)
+    finally:  # later runs in the same process don't collect samples
+        metrics.enable(was_enabled)
+    return state
+
+
+def _parse(xml_filename, max_workers, rate_limit, use_cache, progress, cancel, urls, retries, listings):
+    ''' parse() without turning metrics on and off. '''
+
+    store = storage.open_storage(xml_filename)  # XML or SQLite, by file extension
+
     # get urls
-    urls = [element.text for element in root.findall('item/url')]
+    tracked = store.tracked_urls()  # [(url, latest price)]
+    if urls is not None:
+        wanted = set(urls)
+        tracked = [(url, latest_price) for url, latest_price in tracked if url in wanted]
+    urls = [url for url, latest_price in tracked]
+
+    cache = http_cache.ValidatorCache(xml_filename + '.cache') if use_cache else None
+    if cache is not None:
+        for url, latest_price in tracked:
+            # no previous price to repeat, or it's not the price page had (deleted from file): page must be parsed
+            if latest_price is None or cache.price(url) != latest_price:
+                cache.forget(url)
+
+    limiter = RateLimiter(rate_limit)
+    retry = http_retry.Retry(retries)
+    breaker = http_retry.CircuitBreaker()
+    started = time.monotonic()
+    state = None
+    done = errors = 0
+    processed = set()  # URLs whose results are in store
+    failed = []        # [date, url, error] for errors log
+
+    harvested = dict()  # url -> ItemData from listing pages
+    if listings:
+        entries = harvest_listings(listings, limiter, retry, breaker)
+        for url, latest_price in tracked:
+            entry = entries.get(_url_key(url))
+            if entry is not None and latest_price is not None:
+                harvested[url] = page_extractor.ItemData(entry.name, entry.price, '', '')
+        metrics.count('harvested', len(harvested))
 
-    urls_len = len(urls)   # to show how many URLs were parsed
-    for counter in range(urls_len):
-        parse_url(root, urls[counter], counter, urls_len)
+    def results():
+        ''' (url, item_data, error): harvested items first, then downloaded pages as they come. '''
 
-    print('Done')
+        for url, item_data in harvested.items():
+            yield url, item_data, None
+        for future in cf.as_completed(futures):  # results come in order of download, not of XML
+            try:
+                yield futures[future], future.result(), None
+            except http_retry.FETCH_ERRORS as page_error:
+                yield futures[future], None, page_error
+
+    pool = cf.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {pool.submit(parse_url, url, limiter, cache, retry, breaker): url
+                   for url in urls if url not in harvested}
+        for url, item_data, error in results():
+            date = dt.datetime.now().strftime('%Y.%m.%d %H:%M')  # date format as 2021.08.24 12:00
+            if error is not None:  # one broken page shouldn't stop update of all others
+                errors += 1
+                failed.append([date, url, str(error)])
+                metrics.count('page_errors')
+            else:
+                store.add_price(url, item_data, date)
+                if cache is not None and item_data is not None and url not in harvested:
+                    cache.set_price(url, str(item_data.price))
+                metrics.count('pages')
+            processed.add(url)
+            done += 1
+            if done % COMMIT_EVERY == 0:
+                with metrics.timer('commit'):
+                    store.commit()
+
+            state = Progress(done, len(urls), errors, time.monotonic() - started, url, item_data, date, error)
+            if progress is not None:
+                progress(state)
+            if cancel is not None and cancel.is_set():
+                break
+    finally:
+        pool.shutdown(cancel_futures=True)    # on error or cancel don't wait for remaining downloads
+
+        # whatever stopped parsing, keep what is parsed
+        with metrics.timer('commit'):
+            store.commit()
+        store.close()
+        _log_errors(xml_filename + '.errors', failed)
+        if cache is not None:
+            for url in urls:
+                if url not in processed:  # downloaded, but price was not saved
+                    cache.forget(url)
+            cache.save()  # after prices, so cache never refers to prices which were not written
+
+    elapsed = time.monotonic() - started
+    print(f'Done: {done} of {len(urls)} pages in {elapsed:.1f} s ({done / elapsed if elapsed else 0:.2f} pages/sec), '
+          f'{errors} errors')
+    metrics.observe('run', elapsed)
     time.sleep(0.5)
+    return state
+
+
+def daemon(xml_filename, interval=scheduler.INTERVAL, jitter=scheduler.JITTER, stop=None,
+           min_interval=scheduler.MIN_INTERVAL, max_interval=scheduler.MAX_INTERVAL, **parse_options):
+    ''' Update items of file forever, a few items at a time. Every item has its own interval between
+        min_interval and max_interval seconds, depending on how often its price changes (see scheduler.py);
+        interval is where items without history start. URLs added to file or removed from it meanwhile
+        are picked up before every run. Setting stop (threading.Event) ends it after current run is saved. '''
+
+    stop = stop or threading.Event()
+    schedule = scheduler.AdaptiveScheduler(interval, jitter, min_interval=min_interval, max_interval=max_interval)
+
+    store = storage.open_storage(xml_filename)
+    try:
+        for record in store.load_items():  # history tells how often price of every item changes
+            if record.url is not None:
+                schedule.learn(record.url, record.prices)
+    finally:
+        store.close()
+
+    while not stop.is_set():
+        store = storage.open_storage(xml_filename)
+        try:
+            schedule.sync(url for url, latest_price in store.tracked_urls())
+        finally:
+            store.close()
+
+        due = schedule.pop_due()
+        if due:
+            parse(xml_filename, cancel=stop, urls=due, **parse_options,
+                  progress=lambda state: schedule.observe(state.url, state.item_data, state.error))
+            schedule.done(due)
+
+        next_time = schedule.next_time()
+        # check file for new URLs at least every batch window even if nothing is due
+        stop.wait(min(next_time - time.time(), schedule.batch_window) if next_time is not None
+                  else schedule.batch_window)
+
+
+def export(xml_filename, output, format='csv'):
+    ''' Write all prices of file to output (text file object): CSV rows name, url, date, price, last seen
+        or JSON list of items with their prices and last seen dates (both by date price changed). '''
+
+    store = storage.open_storage(xml_filename)
+    try:
+        if format == 'json':
+            json.dump([{'name': record.name.strip(), 'url': record.url, 'info': record.info, 'image': record.image,
+                        'prices': {date: price for date, price, seen in record.prices},
+                        'last_seen': {date: seen for date, price, seen in record.prices}}
+                       for record in store.load_items()],
+                      output, ensure_ascii=False, indent=1)
+            output.write('\n')
+        else:
+            writer = csv.writer(output)
+            writer.writerow(['name', 'url', 'date', 'price', 'last_seen'])
+            for record in store.load_items():
+                writer.writerows([record.name.strip(), record.url, date, price, seen]
+                                 for date, price, seen in record.prices)
+    finally:
+        store.close()
+
+
+def print_stats(xml_filename, output=sys.stdout):
+    ''' Table of price statistics of every item (see price_stats.py). '''
+
+    import product_base  # only this command needs items in memory
+
+    pbase = product_base.ProductBase(xml_filename)
+    print(f'{"latest":>8} {"min":>8} {"max":>8} {"mean":>8} {"moving":>8} {"volat.":>7}  name', file=output)
+    for item in pbase.items:
+        stats = pbase.stats.get(item.url)
+        if stats is None or stats.count == 0:
+            print(f'{"-":>8} {"-":>8} {"-":>8} {"-":>8} {"-":>8} {"-":>7}  {item.name}', file=output)
+        else:
+            print(f'{stats.latest:>8} {stats.minimum:>8} {stats.maximum:>8} {stats.mean:>8} '
+                  f'{stats.moving_average():>8} {stats.volatility:>7.2%}  {item.name}', file=output)
+    print(f'Total of latest prices: {pbase.stats.total()}', file=output)
+
+
+def main(argv=None):
+    ''' Command line interface, works without GUI (and doesn't import tkinter/PIL). '''
+
+    parser = argparse.ArgumentParser(prog='python -m tcxml', description='Collect TopComputer.Ru prices without GUI.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = commands.add_parser('update', help='update prices of all items once')
+    daemon_parser = commands.add_parser('daemon', help='keep updating items periodically until stopped')
+    for command_parser in (update_parser, daemon_parser):
+        command_parser.add_argument('file', help='XML or SQLite file with items')
+        command_parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                                    help=f'pages downloaded at once (default {MAX_WORKERS})')
+        command_parser.add_argument('--rate-limit', type=float, default=RATE_LIMIT,
+                                    help=f'max requests per second to site, 0 for no limit (default {RATE_LIMIT})')
+        command_parser.add_argument('--no-cache', action='store_true', help='download and parse every page in full')
+        command_parser.add_argument('--retries', type=int, default=http_retry.RETRIES,
+                                    help=f'repeats of failed download (default {http_retry.RETRIES})')
+        command_parser.add_argument('--metrics', help='write timings of every run to this file '
+                                                      '(Prometheus text format if it ends with .prom, else JSON)')
+    update_parser.add_argument('--listing', action='append', default=[], metavar='URL',
+                               help='category or search page listing tracked items, their prices are taken from it '
+                                    'instead of downloading every item page (may be repeated)')
+    daemon_parser.add_argument('--interval', type=float, default=scheduler.INTERVAL / 3600,
+                               help=f'hours between updates of item without history (default {scheduler.INTERVAL / 3600:g})')
+    daemon_parser.add_argument('--min-interval', type=float, default=scheduler.MIN_INTERVAL / 3600,
+                               help=f'hours between updates of most volatile items (default {scheduler.MIN_INTERVAL / 3600:g})')
+    daemon_parser.add_argument('--max-interval', type=float, default=scheduler.MAX_INTERVAL / 3600,
+                               help=f'hours between updates of stable or discontinued items '
+                                    f'(default {scheduler.MAX_INTERVAL / 3600:g})')
+    daemon_parser.add_argument('--jitter', type=float, default=scheduler.JITTER,
+                               help=f'random variation of interval, fraction of it (default {scheduler.JITTER})')
+
+    export_parser = commands.add_parser('export', help='write all prices as CSV or JSON')
+    export_parser.add_argument('file', help='XML or SQLite file with items')
+    export_parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    export_parser.add_argument('-o', '--output', help='output file (default stdout)')
+
+    stats_parser = commands.add_parser('stats', help='show price statistics of every item')
+    stats_parser.add_argument('file', help='XML or SQLite file with items')
+
+    args = parser.parse_args(argv)
+
+    if args.command in ('update', 'daemon'):
+        stop = threading.Event()  # Ctrl+C or kill: save what's parsed and exit
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, lambda *_: stop.set())
+        options = dict(max_workers=args.workers, rate_limit=args.rate_limit, use_cache=not args.no_cache,
+                       retries=args.retries, metrics_file=args.metrics)
+        if args.command == 'update':
+            parse(args.file, cancel=stop, listings=args.listing, **options)
+        else:
+            daemon(args.file, args.interval * 3600, args.jitter, stop,
+                   args.min_interval * 3600, args.max_interval * 3600, **options)
+
+    elif args.command == 'export':
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as output:
+                export(args.file, output, args.format)
+        else:
+            export(args.file, sys.stdout, args.format)
 
-    data.write(xml_filename, encoding='utf-8', xml_declaration=True)
+    elif args.command == 'stats':
+        print_stats(args.file)
 
 
-if __name__ == '__main__':  # test
-    parse('new_pc - копия.xml')
+if __name__ == '__main__':
+    main()
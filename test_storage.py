@@ -0,0 +1,81 @@
+''' Tests of storage.py:  python -m unittest test_storage '''
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import storage
+from page_extractor import ItemData
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.folder.name, 'prices.xml')
+        with open(self.filename, 'w', encoding='utf-8') as xml_file:  # big enough not to be compacted on commit
+            xml_file.write("<?xml version='1.0' encoding='utf-8'?><root>")
+            for n in range(1, 4):
+                xml_file.write(f'<item name="Item {n}"><url>https://t/{n}/</url><info>{"x" * 1000}</info></item>')
+            xml_file.write('</root>')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def prices(self):
+        return {record.url: [price[1] for price in record.prices]
+                for record in storage.XMLStorage(self.filename).load_items()}
+
+    def test_commit_after_torn_line(self):
+        store = storage.XMLStorage(self.filename)
+        store.add_price('https://t/1/', ItemData('Item 1', '100', '', 'info'), '2021.01.01 10:00')
+        store.commit()
+        with open(store.journal_filename, 'a', encoding='utf-8') as journal:  # crash in the middle of write
+            journal.write('["price", ["url", "https://t/3/"], "2021.01')
+
+        store = storage.XMLStorage(self.filename)
+        store.add_price('https://t/2/', ItemData('Item 2', '200', '', 'info'), '2021.01.02 10:00')
+        store.commit()
+
+        self.assertEqual(self.prices(), {'https://t/1/': ['100'], 'https://t/2/': ['200'], 'https://t/3/': []})
+        storage.compact(self.filename)
+        self.assertEqual(self.prices(), {'https://t/1/': ['100'], 'https://t/2/': ['200'], 'https://t/3/': []})
+
+    def test_items_with_same_name(self):
+        store = storage.XMLStorage(self.filename)
+        for n in range(1, 4):
+            store.add_price(f'https://t/{n}/', ItemData('', str(n), '', 'info'), '2021.01.01 10:00')
+        store.commit()
+        self.assertEqual(self.prices(), {'https://t/1/': ['1'], 'https://t/2/': ['2'], 'https://t/3/': ['3']})
+
+
+class SQLiteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.folder.name, 'prices.sqlite')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_unique_name_is_dropped(self):
+        db = sqlite3.connect(self.filename)  # database made when names were unique
+        db.executescript(storage.SQLiteStorage.SCHEMA.replace('name TEXT NOT NULL,', 'name TEXT NOT NULL UNIQUE,'))
+        db.execute("INSERT INTO items VALUES (5, 'Item', 'https://t/1/', 'info', NULL)")
+        db.execute("INSERT INTO prices VALUES (5, '2021.01.01 10:00', '100', NULL)")
+        db.commit()
+        db.close()
+
+        store = storage.SQLiteStorage(self.filename)
+        store.db.execute('PRAGMA foreign_keys = ON')
+        store.add_price('https://t/2/', ItemData('Item', '200', '', 'info'), '2021.01.02 10:00')
+        store.commit()
+        self.assertEqual(store.db.execute('PRAGMA foreign_key_check').fetchall(), [])
+        self.assertEqual([(record.url, record.prices[-1][1]) for record in store.dump()],
+                         [('https://t/1/', '100'), ('https://t/2/', '200')])
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+''' Widgets for long lists: item picker with type-ahead search and price table which shows
+    thousands of rows while having only visible ones in Treeview. '''
+
+import bisect
+
+from tkinter.ttk import Combobox, Frame, Scrollbar, Treeview
+
+
+MAX_SHOWN = 500  # names in dropdown list of picker; more only make it slow, typing narrows them down
+
+
+class NameIndex:
+    ''' Finds names by typed text: names starting with it first (binary search over sorted names),
+        then other names containing it. Text which extends previous one is searched for only in previous results. '''
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._lower = [name.lower() for name in self.names]
+        self._sorted = sorted(range(len(self.names)), key=self._lower.__getitem__)  # indices of names, alphabetically
+        self._sorted_keys = [self._lower[index] for index in self._sorted]
+        self._last = ('', None)  # previous text and indices of names containing it
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, text, limit=MAX_SHOWN):
+        text = text.strip().lower()
+        if not text:
+            return self.names[:limit]
+
+        last_text, last_found = self._last
+        candidates = last_found if last_found is not None and last_text in text else range(len(self.names))
+        found = [index for index in candidates if text in self._lower[index]]
+        self._last = (text, found)
+
+        prefixed = []
+        position = bisect.bisect_left(self._sorted_keys, text)
+        while (position < len(self._sorted_keys) and self._sorted_keys[position].startswith(text)
+               and len(prefixed) < limit):
+            prefixed.append(self._sorted[position])
+            position += 1
+        prefixed_set = set(prefixed)
+        ordered = prefixed + [index for index in found if index not in prefixed_set]
+        return [self.names[index] for index in ordered[:limit]]
+
+
+class FilterCombobox(Combobox):
+    ''' Editable Combobox: typing narrows dropdown list to matching names (see NameIndex),
+        Enter selects first of them. Selection generates <<ComboboxSelected>> as usual. '''
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.name_index = NameIndex([])
+        self.bind('<KeyRelease>', self._on_key)
+        self.bind('<Return>', self._on_return)
+
+    def set_names(self, names):
+        self.name_index = NameIndex(names)
+        self.config(values=self.name_index.search(''))
+
+    def _on_key(self, event):
+        if event.keysym in ('Return', 'Up', 'Down', 'Escape', 'Tab'):
+            return
+        self.config(values=self.name_index.search(self.get()))
+
+    def _on_return(self, event):
+        values = self['values']
+        if values and self.get() not in values:
+            self.set(values[0])
+        self.event_generate('<<ComboboxSelected>>')
+
+
+class VirtualTable(Frame):
+    ''' Treeview with its own scrolling over rows given by row(index) -> values: only visible rows exist
+        as Treeview items and are refilled on scroll, so showing any number of rows takes the same time. '''
+
+    def __init__(self, master=None, height=18, columns=(), **options):
+        ''' columns is [(heading, width, anchor)]. '''
+
+        super().__init__(master, **options)
+        self.height = height
+        self._count = 0
+        self._row = None
+        self._offset = 0  # index of first visible row
+
+        names = [f'col{n + 1}' for n in range(len(columns))]
+        self.tree = Treeview(self, height=height, show='headings', columns=names)
+        for name, (heading, width, anchor) in zip(names, columns):
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, anchor=anchor, width=width)
+
+        self.vscroll = Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+        self.vscroll.pack(side='right', fill='y')
+        self.tree.pack(side='top')
+
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-1))  # mouse wheel on X11
+        self.tree.bind('<Button-5>', lambda event: self.scroll(1))
+        self.tree.bind('<Up>', lambda event: self._move_focus(-1))
+        self.tree.bind('<Down>', lambda event: self._move_focus(1))
+
+    def set_rows(self, count, row):
+        ''' Show count rows, row(index) gives values of row. '''
+
+        self._count = count
+        self._row = row
+        self._offset = 0
+        self._fill()
+
+    def refresh(self, count):
+        ''' Rows have changed (e.g. one was deleted), keep scroll position. '''
+
+        self._count = count
+        self._fill()
+
+    def clear(self):
+        self.set_rows(0, None)
+
+    def _fill(self):
+        self._offset = max(0, min(self._offset, self._count - self.height))
+        visible = min(self.height, self._count - self._offset)
+        children = self.tree.get_children()
+        for child in children[visible:]:
+            self.tree.delete(child)
+        for position in range(visible):
+            values = self._row(self._offset + position)
+            if position < len(children):
+                self.tree.item(children[position], values=values)
+            else:
+                self.tree.insert('', index='end', values=values)
+
+        if self._count:
+            self.vscroll.set(self._offset / self._count, (self._offset + visible) / self._count)
+        else:
+            self.vscroll.set(0, 1)
+
+    def scroll(self, rows):
+        self._offset += rows
+        self._fill()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._offset = int(float(amount) * self._count)
+            self._fill()
+        else:  # 'scroll', amount is number of units or pages
+            self.scroll(int(amount) * (self.height if unit == 'pages' else 1))
+
+    def _move_focus(self, step):
+        ''' Arrow keys at the edge of visible rows scroll the table. '''
+
+        children = self.tree.get_children()
+        focus = self.tree.focus()
+        if not children or focus not in children:
+            return None
+        position = children.index(focus) + step
+        if 0 <= position < len(children):
+            return None  # Treeview moves focus itself
+        self.scroll(step)
+        edge = children[0] if step < 0 else children[-1]
+        self.tree.focus(edge)
+        self.tree.selection_set(edge)
+        return 'break'
+
+    def focused_index(self):
+        ''' Index of row with keyboard focus, None if there is none. '''
+
+        children = self.tree.get_children()
+        focus = self.tree.focus()
+        if focus not in children:
+            return None
+        return self._offset + children.index(focus)